@@ -0,0 +1,106 @@
+import os
+import re
+import json
+import hashlib
+import tempfile
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+def default_cache_path(folder: str, cache_dir: Optional[str] = None) -> str:
+    """
+    Returns the path of the index cache of the 'folder' in the 'cache_dir' (the system's
+    temporary folder by default), named after the folder's absolute path.
+    """
+    folder_hash = hashlib.sha1(os.path.abspath(folder).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir or tempfile.gettempdir(), f"input_index_{folder_hash}.json")
+
+
+class FolderIndex:
+    """
+    Groups the files of a folder into tuples, e.g. [raw_image, mask_image] of the same
+    time point, based on a regular expression applied on the file names: the named group
+    'key' says which files belong together, and the optional named group 'role' says
+    what position a file takes within its tuple (in the order of the 'roles').
+    Without 'roles', a tuple is made of all files of the same 'key', sorted by name.
+
+    The folder is listed with one 'os.scandir()', and the index is optionally cached in
+    the 'cache_path' file. A rescan of an unchanged folder (by its mtime) costs then only
+    a single 'stat()', and in a changed folder only the new file names are examined.
+    The cache file should live outside the indexed folder (see 'default_cache_path()'),
+    the input folder is never written to (and may be read-only).
+    """
+    def __init__(self, folder: str,
+                 pattern: str = r'^(?P<key>\d+).*?(?P<role>raw|mask)\.tiff?$',
+                 roles: Optional[Sequence[str]] = ('raw', 'mask'),
+                 cache_path: Optional[str] = None):
+        self.folder = folder
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.roles = list(roles) if roles is not None else None
+        self.cache_path = cache_path
+        self.entries: Dict[str, Optional[Dict]] = dict()  # file name -> its 'key' and 'role', or None
+
+    def scan(self):
+        folder_mtime_ns = os.stat(self.folder).st_mtime_ns
+        cache = self._load_cache()
+        if cache is not None and cache['folder_mtime_ns'] == folder_mtime_ns:
+            self.entries = cache['entries']
+            return
+
+        cached_entries = cache['entries'] if cache is not None else dict()
+        entries = dict()
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name in cached_entries:
+                    entries[entry.name] = cached_entries[entry.name]
+                    continue
+                if not entry.is_file():
+                    continue
+                m = self.regex.match(entry.name)
+                if m is None:
+                    entries[entry.name] = None  # remember also the non-matching ones, not to examine them again
+                    continue
+                groups = m.groupdict()
+                entries[entry.name] = { 'key': groups['key'], 'role': groups.get('role') }
+
+        self.entries = entries
+        self._save_cache(folder_mtime_ns)
+
+    def groups(self) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Yields '(key, [file paths])' of complete tuples, sorted by the key (numerically if
+        possible); with 'roles', tuples that miss any role are skipped.
+        """
+        by_key: Dict[str, Dict[str, str]] = dict()
+        for name,entry in self.entries.items():
+            if entry is None: continue
+            by_key.setdefault(entry['key'], dict())[name] = entry['role']
+
+        def sort_key(key): return (0, int(key), key) if key.isdigit() else (1, 0, key)
+
+        for key in sorted(by_key, key=sort_key):
+            names = by_key[key]
+            if self.roles is None:
+                yield key, [ os.path.join(self.folder, n) for n in sorted(names) ]
+                continue
+            by_role = { role:name for name,role in names.items() }
+            if all(role in by_role for role in self.roles):
+                yield key, [ os.path.join(self.folder, by_role[role]) for role in self.roles ]
+
+    def _load_cache(self) -> Optional[Dict]:
+        if self.cache_path is None or not os.path.exists(self.cache_path): return None
+        with open(self.cache_path, 'r') as f:
+            cache = json.load(f)
+        valid = cache.get('pattern') == self.pattern and cache.get('folder') == os.path.abspath(self.folder)
+        return cache if valid else None
+
+    def _save_cache(self, folder_mtime_ns: int):
+        if self.cache_path is None: return
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._cache_content(folder_mtime_ns), f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _cache_content(self, folder_mtime_ns: int) -> Dict:
+        return { 'folder': os.path.abspath(self.folder), 'pattern': self.pattern,
+                 'folder_mtime_ns': folder_mtime_ns, 'entries': self.entries }
@@ -1,10 +1,115 @@
+import os
 import numpy as np
+import queue
+import threading
+
+
+def run_pipelined(input_groups, process_fun, submit_fun, prefetch: int = 2, writeback: int = 2) -> int:
+    """
+    Runs the three stages: fetching of the input groups, their processing, and submitting
+    of the results -- all at the same time. While the group N is processed (in this thread),
+    the group N+1 is already being fetched (in a reader thread, by iterating 'input_groups'),
+    and the results of the group N-1 are being submitted (in a writer thread, by calling
+    'submit_fun(N-1, result)'). The throughput thus approaches the one of the slowest stage.
+
+    Not more than 'prefetch' fetched groups and 'writeback' results are waiting in the queues
+    between the stages, to keep the memory bounded. An exception raised in any stage stops
+    the pipeline and is re-raised here.
+
+    Returns the number of processed groups.
+    """
+    END = object()  # marks the end of the stream of items in a queue
+    inputs_q = queue.Queue(maxsize=max(1, prefetch))
+    results_q = queue.Queue(maxsize=max(1, writeback))
+    failures = []
+    stop_flag = threading.Event()
+
+    def put_unless_stopped(q, item):
+        while not stop_flag.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                pass
+
+    def reader():
+        try:
+            for group in input_groups:
+                put_unless_stopped(inputs_q, group)
+                if stop_flag.is_set(): break
+        except Exception as e:
+            failures.append(e)
+        finally:
+            put_unless_stopped(inputs_q, END)
+
+    def writer():
+        while True:
+            item = results_q.get()
+            if item is END: return
+            try:
+                if not stop_flag.is_set(): submit_fun(*item)
+            except Exception as e:
+                failures.append(e)
+                stop_flag.set()
+
+    reader_thread = threading.Thread(target=reader, name="groupsFetcher", daemon=True)
+    writer_thread = threading.Thread(target=writer, name="resultsSubmitter", daemon=True)
+    reader_thread.start()
+    writer_thread.start()
+
+    count = 0
+    try:
+        while not stop_flag.is_set():
+            try:
+                group = inputs_q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if group is END: break
+            results_q.put((count, process_fun(group)))
+            count += 1
+    except Exception as e:
+        failures.append(e)
+    finally:
+        results_q.put(END)   # the writer keeps draining the queue, so this never blocks for long
+        writer_thread.join()
+        stop_flag.set()      # releases the reader if it waits on a full queue
+        reader_thread.join()
+
+    if failures: raise failures[0]
+    return count
+
+
+def fetch_groups():
+    # fake input images, would be taken from OMERO normally
+    for i in range(3):
+        yield [ np.zeros((30+i,20+2*i)) ]
+
+
+def fetch_groups_from_folder(input_folder: str):
+    # tuples of files are established from their names, and read only when asked for;
+    # the index is cached outside the input folder (which is left untouched), in the
+    # INPUT_INDEX_CACHE_DIR if given (e.g. a persistent working volume), else in the temp folder
+    import tifffile as TIFF
+    from input_indexer import FolderIndex, default_cache_path
+
+    cache_path = default_cache_path(input_folder, os.environ.get('INPUT_INDEX_CACHE_DIR'))
+    index = FolderIndex(input_folder, cache_path=cache_path)
+    index.scan()
+    for key,paths in index.groups():
+        print(f"fetching group {key}: {paths}")
+        yield [ TIFF.imread(p) for p in paths ]
+
+
+def submit_result(group_index, result_group):
+    # submit 'result_group' back to OMERO
+    pass
+
 
 def biomero_entry_point(args):
 
     # ------------ CHANGE HERE ------------
     import image_processing as IP
-    IP.initiate_resources(42, 24)
+    init_args = (42, 24)
     # ------------ CHANGE HERE ------------
 
     # LOOP HERE, the simulated loop should do:
@@ -14,16 +119,23 @@ def biomero_entry_point(args):
     #   - submit the tuple to the IP.process(...tuple/list...),
     #     and collect result(s)
     #   - save the result(s)
-    for i in range(3):
-        # fake input image, would be taken from OMERO normally
-        group_input_number_i = [ np.zeros((30+i,20+2*i)) ]
+    #
+    # the fetching of the next tuple and the saving of the previous result(s)
+    # happen in parallel with the processing of the current tuple
+    input_groups = fetch_groups_from_folder(args[0]) if len(args) > 0 else fetch_groups()
 
-        result_group_number_i = IP.process(group_input_number_i)
-        # submit 'result_group_number_i' back to OMERO
-
-    IP.release_resources()
+    num_workers = int(os.environ.get('NUM_WORKERS', 1))
+    if num_workers > 1:
+        # several worker processes, each initiates (and releases) its own resources
+        from worker_pool import process_with_worker_pool
+        for index,result_group in process_with_worker_pool(input_groups, num_workers, IP.__name__, init_args):
+            submit_result(index, result_group)
+    else:
+        IP.initiate_resources(*init_args)
+        run_pipelined(input_groups, IP.process, submit_result)
+        IP.release_resources()
 
 
 if __name__ == '__main__':
-    biomero_entry_point([])
-
+    import sys
+    biomero_entry_point(sys.argv[1:])
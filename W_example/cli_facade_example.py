@@ -3,21 +3,43 @@ import click
 @click.command()
 @click.option('--in_file_path',  type=click.STRING, help='Path to the input image')
 @click.option('--out_file_path', type=click.STRING, help='Path to the output image')
-def cli_wrapper(in_file_path:str, out_file_path:str):
+@click.option('--in_glob',       type=click.STRING, help='Batch mode: glob pattern of the input images')
+@click.option('--in_folder',     type=click.STRING, help='Batch mode: folder with the input images (*.tif, *.tiff)')
+@click.option('--in_list',       type=click.STRING, help='Batch mode: text file with one input image path per line')
+@click.option('--out_dir',       type=click.STRING, default='.', show_default=True, help='Batch mode: folder for the output images')
+@click.option('--out_template',  type=click.STRING, default='{stem}_out.tif', show_default=True,
+              help='Batch mode: output file name made from the input {name} or {stem}')
+@click.option('--workers',       type=click.INT, default=1, show_default=True, help='Batch mode: number of parallel worker processes')
+@click.option('--skip_existing', is_flag=True, help='Batch mode: do not process inputs whose output exists already')
+def cli_wrapper(in_file_path:str, out_file_path:str,
+                in_glob:str, in_folder:str, in_list:str, out_dir:str, out_template:str,
+                workers:int, skip_existing:bool):
     """
     An CLI-friendly wrapper to test my own 'image_processing' directly
     and locally on some user-given input image. For BIOMERO dockerized
     solution, for example, this file is not required.
+
+    In the batch mode, many images are processed in one run, and so the
+    start-up costs (the imports and the 'initiate_resources()') are paid
+    only once per run (or once per worker), not once per image.
     """
 
+    batch_mode = in_glob or in_folder or in_list
+
     # just a sanity check, with an attempt to advise...
-    if not in_file_path or not out_file_path:
+    if not batch_mode and (not in_file_path or not out_file_path):
         import sys
         print("Not happy with the parameters...\n")
         ctx = click.core.Context(cli_wrapper, info_name=sys.argv[0])
         print(cli_wrapper.get_help(ctx))
         return
 
+    if batch_mode:
+        in_out_paths = list_batch_inputs(in_glob, in_folder, in_list, out_dir, out_template, skip_existing)
+        print(f"batch of {len(in_out_paths)} images to be processed")
+        if len(in_out_paths) > 0: process_batch(in_out_paths, workers)
+        return
+
 
     # from here follows the real utilization of the 'image_processing' code
     import tifffile as TIFF
@@ -34,6 +56,99 @@ def cli_wrapper(in_file_path:str, out_file_path:str):
     IP.release_resources()
 
 
+def list_batch_inputs(in_glob:str, in_folder:str, in_list:str, out_dir:str, out_template:str, skip_existing:bool):
+    import os
+    import glob
+
+    in_paths = []
+    if in_glob: in_paths += sorted(glob.glob(in_glob))
+    if in_folder: in_paths += sorted(glob.glob(os.path.join(in_folder, '*.tif')) + glob.glob(os.path.join(in_folder, '*.tiff')))
+    if in_list:
+        with open(in_list, 'r') as f:
+            in_paths += [ line.strip() for line in f if line.strip() ]
+
+    os.makedirs(out_dir, exist_ok=True)
+    in_out_paths = []
+    for in_path in in_paths:
+        name = os.path.basename(in_path)
+        out_path = os.path.join(out_dir, out_template.format(name=name, stem=os.path.splitext(name)[0]))
+        if skip_existing and os.path.exists(out_path):
+            print(f"skipping {in_path}, its output exists already")
+            continue
+        in_out_paths.append((in_path, out_path))
+    return in_out_paths
+
+
+def read_input_group(in_path:str):
+    # an unreadable input is reported the same way as a failed processing
+    import tifffile as TIFF
+    try:
+        return [ TIFF.imread(in_path) ]
+    except Exception as e:
+        return ('FAIL', f"cannot read: {e}")
+
+
+def is_failure(result):
+    return isinstance(result, tuple) and len(result) == 2 and result[0] == 'FAIL'
+
+
+def process_or_fail(IP, input_group):
+    # the same reporting of a failure as from the worker pool
+    if is_failure(input_group): return input_group
+    try:
+        return IP.process(input_group)
+    except Exception as e:
+        return ('FAIL', str(e))
+
+
+def process_with_pool(in_out_paths, workers:int, IP):
+    # the images are read only when the pool asks for them; the unreadable ones
+    # are not sent to the pool at all, their failures are passed on right away
+    from worker_pool import process_with_worker_pool
+
+    pool_to_batch_index = []
+    failed_reads = []
+    def readable_groups():
+        for index,(in_path,_) in enumerate(in_out_paths):
+            group = read_input_group(in_path)
+            if is_failure(group):
+                failed_reads.append((index, group))
+                continue
+            pool_to_batch_index.append(index)
+            yield group
+
+    for pool_index,result in process_with_worker_pool(readable_groups(), workers, IP.__name__, (42, 24)):
+        while failed_reads: yield failed_reads.pop(0)
+        yield pool_to_batch_index[pool_index], result
+    while failed_reads: yield failed_reads.pop(0)
+
+
+def process_batch(in_out_paths, workers:int):
+    import tifffile as TIFF
+    import image_processing as IP
+
+    if workers > 1:
+        results = process_with_pool(in_out_paths, workers, IP)
+    else:
+        IP.initiate_resources(42, 24)
+        results = ( (index, process_or_fail(IP, read_input_group(in_path)))
+                    for index,(in_path,_) in enumerate(in_out_paths) )
+
+    try:
+        for index,result in results:
+            in_path,out_path = in_out_paths[index]
+            if is_failure(result):
+                print(f"failed processing {in_path}: {result[1]}")
+                continue
+            try:
+                TIFF.imwrite(out_path, result[0])
+            except Exception as e:
+                print(f"failed writing {out_path}: {e}")
+                continue
+            print(f"processed {in_path} -> {out_path}")
+    finally:
+        if workers <= 1: IP.release_resources()
+
+
 if __name__ == '__main__':
     cli_wrapper()
-
@@ -0,0 +1,80 @@
+import importlib
+import multiprocessing
+import queue
+
+
+def _worker_loop(module_name, init_args, tasks_q, results_q):
+    # one worker process: initiates the resources once, processes many groups, releases at the end
+    IP = importlib.import_module(module_name)
+    IP.initiate_resources(*init_args)
+    try:
+        while True:
+            task = tasks_q.get()
+            if task is None: break
+            index, input_group = task
+            try:
+                results_q.put((index, IP.process(input_group)))
+            except Exception as e:
+                results_q.put((index, ('FAIL', str(e))))
+    finally:
+        IP.release_resources()
+
+
+def process_with_worker_pool(input_groups, num_workers: int,
+                             module_name: str = 'image_processing', init_args: tuple = (),
+                             max_in_flight: int = None):
+    """
+    Processes the 'input_groups' (any iterable) with 'N = num_workers' worker processes,
+    each of which imports the 'module_name', calls its 'initiate_resources(*init_args)'
+    exactly once, then calls its 'process()' on as many groups as it gets, and calls its
+    'release_resources()' when there's no more work.
+
+    Not more than 'max_in_flight' groups (default: twice the 'num_workers') are handed
+    over to the workers at any moment. A group whose processing raised an exception
+    gets the result '('FAIL', error_message)'.
+
+    Returns:
+        Generator of '(index, result)' pairs, in the order of completion, where 'index'
+        is the position of the group in the 'input_groups'.
+    """
+    if max_in_flight is None: max_in_flight = 2*num_workers
+    tasks_q = multiprocessing.Queue()
+    results_q = multiprocessing.Queue()
+    workers = [ multiprocessing.Process(target=_worker_loop, name=f"imgProcessor-{i}",
+                                        args=(module_name, init_args, tasks_q, results_q))
+                for i in range(max(1, num_workers)) ]
+    for w in workers: w.start()
+
+    try:
+        inputs_iter = iter(input_groups)
+        submitted, received = 0, 0
+        inputs_exhausted = False
+        while True:
+            while not inputs_exhausted and submitted - received < max_in_flight:
+                try:
+                    tasks_q.put((submitted, next(inputs_iter)))
+                    submitted += 1
+                except StopIteration:
+                    inputs_exhausted = True
+
+            if inputs_exhausted and received == submitted: break
+
+            try:
+                index, result = results_q.get(timeout=1.0)
+            except queue.Empty:
+                if not all(w.is_alive() for w in workers):
+                    raise RuntimeError("A worker process has ended unexpectedly")
+                continue
+            received += 1
+            yield index, result
+
+    finally:
+        # one "no more work" per worker, they release their resources then;
+        # results not yet collected (when stopped early) must be drained for the workers to end
+        for _ in workers: tasks_q.put(None)
+        while any(w.is_alive() for w in workers):
+            try:
+                results_q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for w in workers: w.join()
@@ -13,6 +13,16 @@ params.group_size = 1
 // - in local config: not more than that processes are created
 params.max_forks = 5
 
+// how the groups are processed:
+// - 'per_group': the 'processor' is started afresh for every group
+// - 'warm': only 'max_forks' long-lived 'warm_processor's are started, each of which
+//           is given its share of the groups on its standard input
+params.mode = 'per_group'
+params.warm_processor = "python /home/ulman/data/Kobe-Hackathon/seg_and_tra_pipeline/W_nextflow/warm_processor.py --module_path /home/ulman/data/Kobe-Hackathon/seg_and_tra_pipeline/W_example --init_args 42 24"
+
+// seconds to wait before a group is processed (was a fixed 2 s), 0 for no waiting
+params.processor_delay = 2
+
 
 process process_list_of_files {
     maxForks params.max_forks
@@ -29,7 +39,7 @@ process process_list_of_files {
     echo -n "processing ${in_files_list} on "
     date
     hostname
-    sleep 2
+    sleep ${params.processor_delay}
     ${params.processor} ${in_files_list}
     echo -n "finished   ${in_files_list} on "
     date
@@ -37,6 +47,30 @@ process process_list_of_files {
 }
 
 
+process process_groups_warm {
+    maxForks params.max_forks
+    publishDir params.output_folder
+
+    input:
+    path in_files_list
+
+    output:
+    path 'res_of_*'
+
+    script:
+    // one line (of space-separated file names) per group
+    groups_lines = [in_files_list].flatten().collate(params.group_size).collect{ "'" + it.join(' ') + "'" }.join(' ')
+    """
+    echo -n "warm processing of ${in_files_list} on "
+    date
+    hostname
+    printf '%s\\n' ${groups_lines} | ${params.warm_processor}
+    echo -n "finished   ${in_files_list} on "
+    date
+    """
+}
+
+
 process echo_somewhere {
     input:
     path in_files_list
@@ -53,9 +87,20 @@ workflow {
     println("LOCAL IMMEDIATE WORKING...")
     println("CONSIDERING "+params.group_size+"-TUPLES...")
 
-    file_list = channel.fromList( files( "${params.input_folder}/*.tif" ).sort() )
-    files_groups = file_list.buffer( size:params.group_size, remainder:true )
+    file_list0 = files( "${params.input_folder}/*.tif" ).sort()
+    file_list = channel.fromList( file_list0 )
+
+    if (params.mode == 'warm') {
+        // every warm processor gets (about) the same number of whole groups
+        groups_count = (int)Math.ceil( file_list0.size() / params.group_size )
+        groups_per_worker = Math.max(1, (int)Math.ceil( groups_count / params.max_forks ))
+        println("CONSIDERING "+groups_per_worker+" TUPLES PER WARM PROCESSOR...")
 
-    process_list_of_files( files_groups )
+        files_groups = file_list.buffer( size:params.group_size*groups_per_worker, remainder:true )
+        process_groups_warm( files_groups )
+    } else {
+        files_groups = file_list.buffer( size:params.group_size, remainder:true )
+        process_list_of_files( files_groups )
+    }
     //echo_somewhere( files_groups, '/dev/pts/13' )
 }
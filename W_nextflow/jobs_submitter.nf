@@ -11,9 +11,25 @@ params.processor_needs_time = 1m
 params.processor_needs_cpus = 2
 //------
 
+// how the groups (tuples) are distributed among the (not more than 'max_pending_jobs') jobs:
+// - 'count': every job gets (about) the same number of groups
+// - 'bytes': every job gets (about) the same total size of files
+// - 'cost':  every job gets (about) the same total cost, as reported by the 'cost_estimator'
+params.packing = 'bytes'
+// NB: A command that is given the files of one group on its command line, and
+//     prints one number on its standard output -- the (estimated) cost to process
+//     the group, e.g. a script that reads only the image headers to return 'Z*Y*X'
+params.cost_estimator = ''
+
 params.local_processor_command = "nextflow run /home/ulman/data/Kobe-Hackathon/seg_and_tra_pipeline/W_nextflow/folder_processor.nf"
 params.local_processor_config_param = "-c /home/ulman/data/Kobe-Hackathon/seg_and_tra_pipeline/W_nextflow/config_node.nextflow"
 
+// whether a job copies its inputs first into a node-local scratch folder, processes
+// them there and copies the results back (instead of working on the shared filesystem)
+params.stage_to_scratch = false
+params.scratch_base = '/tmp'
+params.stage_and_run = "/home/ulman/data/Kobe-Hackathon/seg_and_tra_pipeline/W_nextflow/stage_and_run.sh"
+
 
 process create_lists_of_files {
     maxForks params.get('max_pending_jobs', 10)
@@ -31,6 +47,16 @@ process create_lists_of_files {
     path in_files_list
 
     script:
+    if (params.stage_to_scratch)
+    """
+    echo -n "JOB submitting ${in_files_list} in folder "
+    pwd
+    ${params.stage_and_run} ${params.scratch_base} . ${params.output_folder} \
+         ${params.local_processor_command} ${params.local_processor_config_param} \
+         --processor ${params.processor} \
+         --group_size ${params.group_size}
+    """
+    else
     """
     echo -n "JOB submitting ${in_files_list} in folder "
     pwd
@@ -43,18 +69,59 @@ process create_lists_of_files {
 }
 
 
+def group_cost(group) {
+    if (params.packing == 'cost') {
+        def estimator = params.cost_estimator.tokenize() + group.collect{ it.toString() }
+        def proc = estimator.execute()
+        def cost = proc.text.trim()
+        proc.waitFor()
+        if (proc.exitValue() != 0) error("cost_estimator failed on ${group}")
+        return cost as double
+    }
+    return group.sum{ it.size() } as double
+}
+
+
+// The "longest processing time first" greedy packing: the groups are examined from
+// the most costly one, and every group is added to the bin (job) with the smallest
+// total cost so far. Only whole groups are moved around, and so the 'group_size'
+// tuples stay together (and stay consecutive even after the job sorts its files again).
+def pack_groups(groups, max_bins) {
+    def bins = (1..Math.min(max_bins, groups.size())).collect{ [cost: 0.0d, groups: []] }
+    groups.collect{ [cost: group_cost(it), files: it] }
+          .sort{ -it.cost }
+          .each{ group ->
+              def bin = bins.min{ it.cost }
+              bin.cost += group.cost
+              bin.groups << group.files
+          }
+    return bins
+}
+
+
 workflow {
     println("SUBMITTING JOBS...")
     println("CONSIDERING "+params.group_size+"-TUPLES...")
 
     file_list0 = files( "${params.input_folder}/*.tif" ).sort()
-
     max_jobs = params.get('max_pending_jobs', 10)
-    cumulation_factor = (int)Math.ceil( file_list0.size() / (params.group_size*max_jobs) )
-    println("CONSIDERING MAX "+cumulation_factor+" TASKS ON A NODE")
 
-    file_list = channel.fromList( file_list0 )
-    files_groups = file_list.buffer( size:params.group_size*cumulation_factor, remainder:true )
+    if (params.packing == 'count') {
+        cumulation_factor = (int)Math.ceil( file_list0.size() / (params.group_size*max_jobs) )
+        println("CONSIDERING MAX "+cumulation_factor+" TASKS ON A NODE")
+
+        file_list = channel.fromList( file_list0 )
+        files_groups = file_list.buffer( size:params.group_size*cumulation_factor, remainder:true )
+    } else {
+        if (params.packing == 'cost' && !params.cost_estimator) error("packing 'cost' requires the 'cost_estimator'")
+        bins = file_list0.size() > 0 ? pack_groups( file_list0.collate(params.group_size), max_jobs ) : []
+        bins.eachWithIndex{ bin, i ->
+            println("JOB ${i}: ${bin.groups.size()} TASKS OF TOTAL ${params.packing} ${bin.cost}")
+        }
+
+        // the files of a job in the original order, so the (last) incomplete tuple stays the last one
+        files_groups = channel.fromList( bins.collect{ bin -> bin.groups.flatten().sort() } )
+    }
 
     create_lists_of_files( files_groups )
 }
@@ -0,0 +1,55 @@
+#!/usr/bin/env bash
+
+# Usage: stage_and_run.sh  scratch_base  input_folder  output_folder  command [its params...]
+#
+# Runs the 'command' on a node-local copy of the 'input_folder' instead of directly on the
+# shared (project) filesystem:
+#  - the whole input folder is copied into the 'scratch_base' in one sequential transfer
+#    (tar stream, symlinks followed -- Nextflow stages the inputs as symlinks, hidden files skipped),
+#  - the command is executed there, with '--input_folder' and '--output_folder' appended
+#    that point into the scratch,
+#  - the outputs are copied back into the 'output_folder' in one batched transfer,
+#  - the times of the staging and of the command are reported, and the scratch is removed;
+#    if the copying back fails, the scratch is kept (and its path printed) to not lose the results.
+
+set -o pipefail
+
+if [ $# -lt 4 ]; then
+    echo "Usage: $0 scratch_base input_folder output_folder command [its params...]"
+    exit 1
+fi
+
+SCRATCH_BASE="$1"
+INPUT_FOLDER="$2"
+OUTPUT_FOLDER="$3"
+shift 3
+
+SCRATCH=$(mktemp -d "$(realpath "$SCRATCH_BASE")/staged_XXXXXX") || exit 1   # absolute, the command runs inside it
+trap 'rm -rf "$SCRATCH"' EXIT
+mkdir -p "$SCRATCH/in" "$SCRATCH/out" "$OUTPUT_FOLDER"
+
+now() { date +%s.%N; }
+
+T0=$(now)
+tar -ch -C "$INPUT_FOLDER" --exclude='./.*' . | tar -x -C "$SCRATCH/in" || exit 1
+T1=$(now)
+
+# the command runs inside the scratch, so its own temporary files (e.g. Nextflow's 'work' folder) stay node-local
+( cd "$SCRATCH" && "$@" --input_folder "$SCRATCH/in" --output_folder "$SCRATCH/out" )
+RETVAL=$?
+T2=$(now)
+
+if ! tar -ch -C "$SCRATCH/out" . | tar -x -C "$OUTPUT_FOLDER"; then
+    trap - EXIT
+    echo "Copying the results back into $OUTPUT_FOLDER failed, they are kept in: $SCRATCH/out" >&2
+    exit 1
+fi
+T3=$(now)
+
+echo "STAGING on $(hostname) of $(du -sh "$SCRATCH/in" | cut -f1) in, $(du -sh "$SCRATCH/out" | cut -f1) out:"
+awk -v t0=$T0 -v t1=$T1 -v t2=$T2 -v t3=$T3 'BEGIN {
+    stage = (t1-t0) + (t3-t2); compute = t2-t1;
+    printf("  copy in %.2f s, compute %.2f s, copy out %.2f s -> staging overhead %.1f %% of the compute time\n",
+           t1-t0, compute, t3-t2, compute > 0 ? 100*stage/compute : 0) }'
+
+exit $RETVAL
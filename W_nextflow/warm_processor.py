@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import os
+import sys
+import ast
+import argparse
+import importlib
+
+# A long-lived ("warm") alternative to the 'processor.sh': one run of this script
+# processes many groups of files, and so the interpreter start, the imports and the
+# 'initiate_resources()' (e.g. loading of a model) are paid only once per run.
+#
+# The groups are read from the standard input (or from a named pipe, FIFO), one
+# group per line with the file names separated by spaces; the files are expected
+# in the current working directory (as Nextflow stages them). The groups are processed
+# with the 'initiate_resources()'/'process()'/'release_resources()' contract, see the
+# 'W_example/image_processing.py', and for every group 'res_of_*' files are created
+# in the current working directory (to make nextflow happy, nextflow is watching for them).
+#
+# A failed group leaves a 'failed_of_<first file stem>.txt' with the error message instead,
+# deliberately outside the 'res_of_*' pattern so that it's not taken for a result; the other
+# groups are still processed, but the script then exits with 1 (and nextflow sees the task failed).
+#
+# HOW TO RUN, example:
+#   printf '%s\n' 'a.tif b.tif' 'c.tif d.tif' | python warm_processor.py --module_path ../W_example --init_args 42 24
+
+
+def parse_init_arg(arg: str):
+    # numbers (and other python literals) are passed as such, the rest as strings
+    try:
+        return ast.literal_eval(arg)
+    except (ValueError, SyntaxError):
+        return arg
+
+
+def read_groups(source):
+    for line in source:
+        files = line.split()
+        if len(files) > 0: yield files
+
+
+def write_results(group_files, results):
+    """
+    Writes the items of the 'results' list of the 'group_files' into 'res_of_<first file>',
+    or 'res_of_<first file stem>_<i>.tif' when there are more items; non-image items are
+    written as text into 'res_of_<first file stem>_<i>.txt'.
+    """
+    import numpy as np
+    import tifffile
+
+    name = os.path.basename(group_files[0])
+    stem = os.path.splitext(name)[0]
+    for i,item in enumerate(results):
+        if isinstance(item, np.ndarray):
+            res_path = f"res_of_{name}" if len(results) == 1 else f"res_of_{stem}_{i}.tif"
+            tifffile.imwrite(res_path, item)
+        else:
+            res_path = f"res_of_{stem}_{i}.txt"
+            with open(res_path, 'w') as f:
+                f.write(f"{item}\n")
+
+    if len(results) == 0:
+        # nothing to save, but the group must leave a trace
+        with open(f"res_of_{stem}.txt", 'w') as f:
+            f.write(f"processed: {' '.join(group_files)}\n")
+
+
+def process_groups(IP, groups) -> int:
+    """
+    Processes the 'groups' (lists of file names) one after another with the module 'IP'
+    (whose resources are initiated already), and returns the number of failed groups.
+    A failed group gets a 'failed_of_<first file stem>.txt' with the error message.
+    """
+    import tifffile
+
+    failed = 0
+    for group_files in groups:
+        print(f"processing {' '.join(group_files)}")
+        try:
+            results = IP.process([ tifffile.imread(f) for f in group_files ])
+            write_results(group_files, results)
+        except Exception as e:
+            failed += 1
+            print(f"failed processing {' '.join(group_files)}: {e}", file=sys.stderr)
+            stem = os.path.splitext(os.path.basename(group_files[0]))[0]
+            with open(f"failed_of_{stem}.txt", 'w') as f:
+                f.write(f"{e}\n")
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Processes groups of files, listed one group per line, in one warm process.")
+    parser.add_argument('--fifo', default=None, help="read the groups from this named pipe instead of the standard input")
+    parser.add_argument('--module', default='image_processing', help="the module with the processing contract (default: %(default)s)")
+    parser.add_argument('--module_path', default=None, help="folder where the 'module' is found")
+    parser.add_argument('--init_args', nargs='*', default=[], help="arguments for the 'initiate_resources()'")
+    args = parser.parse_args()
+
+    if args.module_path is not None: sys.path.insert(0, args.module_path)
+    IP = importlib.import_module(args.module)
+    IP.initiate_resources(*[ parse_init_arg(a) for a in args.init_args ])
+
+    try:
+        if args.fifo is not None:
+            with open(args.fifo, 'r') as source:
+                failed = process_groups(IP, read_groups(source))
+        else:
+            failed = process_groups(IP, read_groups(sys.stdin))
+    finally:
+        IP.release_resources()
+
+    if failed > 0:
+        print(f"{failed} group(s) failed", file=sys.stderr)
+        sys.exit(1)
@@ -16,6 +16,9 @@
 
 # HOW TO RUN, example:
 # sbatch --array=1-6 0_slurmFacade_startHere.sh
+#
+# or, to let the array tasks claim time points dynamically from a shared queue:
+# SCHEDULING=dynamic sbatch --array=1-6 0_slurmFacade_startHere.sh
 
 
 cd /mnt/proj2/dd-24-22/Mastodon_paper/code/seg_and_tra_pipeline/
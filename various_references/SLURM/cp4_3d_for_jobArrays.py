@@ -5,6 +5,14 @@ input_filepath  = '/mnt/proj2/dd-24-22/Mastodon_paper/orig_as_CTC__1px_markers'
 output_filepath = '/mnt/proj2/dd-24-22/Mastodon_paper/orig_as_CTC__1px_markers/SEG'
 last_tp = 600
 
+# big volumes can be segmented in overlapping tiles, with memory demands given by the tile size
+# (and not by the volume size); 'None' means to segment the whole volume in one go
+tile_shape = None     # e.g. (64, 1024, 1024) in z,y,x
+tile_overlap = (16, 64, 64)
+
+# encoding of the written masks, see util/tiff_writing.PRESETS
+output_preset = 'balanced'
+
 
 # ----------------------------------------------
 # JOBS SITUATION:
@@ -25,6 +33,14 @@ worker_total = int(os.environ.get('SLURM_ARRAY_TASK_COUNT',1))
 # and without any special preparations (like setting up the two variables), in which case
 # this script will sequentially execute the whole workload...
 
+scheduling = os.environ.get('SCHEDULING','static')
+#
+# 'static'  -- every worker gets its own contiguous block of time points (see below)
+# 'dynamic' -- workers claim time points one by one from a shared queue (in 'queue_folder'),
+#              so that the faster workers take over more time points and all finish together;
+#              a restarted worker re-processes only the unclaimed, its interrupted, and failed time points
+queue_folder = os.environ.get('QUEUE_FOLDER', f"{output_filepath}/.tp_queue")
+
 def get_list_of_indices_for_this_worker(worker_id, number_of_all_workers_avaible, all_jobs_list):
     """
     Assuming 'number_of_all_workers_avaible' >= 1 and 'worker_id' in [1, number_of_all_workers_avaible]
@@ -48,25 +64,69 @@ def get_list_of_indices_for_this_worker(worker_id, number_of_all_workers_avaible
 # ----------------------------------------------
 # THE WORKHORSE SCRIPT ITSELF:
 
+import sys
 import torch
 import numpy as np
 from cellpose import models
 import tifffile as TIFF
 
+# make the 'util' folder (one level up) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from util.work_queue import FileClaimQueue
+from util.checkpointing import CheckpointManifest
+from util.tiff_writing import write_tiff
+from util.tiling import segment_tiled
+
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 print(f"Will use: {device}")
 
 model = models.CellposeModel(device=device)
 
 all_jobs_indexes = [ tp for tp in range(0, last_tp+1) ]  # time points range from  0 till the last one inclusively (that's +1)
-this_job_indexes = get_list_of_indices_for_this_worker(worker_index, worker_total, all_jobs_indexes)
 
-for t in this_job_indexes:
+# completed time points are recorded here, and skipped when the job is restarted
+manifest = CheckpointManifest(f"{output_filepath}/.manifest")
+eval_params = dict(channel_axis = 0, z_axis = 1, normalize=True, do_3D=True, niter=2000)
+manifest_params = dict(eval_params, tile_shape=tile_shape, tile_overlap=tile_overlap)
+
+def segment_volume(img):
+    mask,_,_ = model.eval(np.reshape(img, (1,*img.shape)), **eval_params)
+    return mask
+
+def process_time_point(t):
+    in_path = f"{input_filepath}/t{t:03}.tif"
+    out_path = f"{output_filepath}/mask{t:03}.tif"
+    if manifest.is_done(out_path, [in_path], manifest_params):
+        print(f"skipping already done TP = {t}")
+        return
     print(f"doing TP = {t}")
 
-    img = TIFF.imread( f"{input_filepath}/t{t:03}.tif" )
-
-    mask,_,_ = model.eval(np.reshape(img, (1,*img.shape)), channel_axis = 0, z_axis = 1, normalize=True, do_3D=True, niter=2000)
-
-    TIFF.imwrite( f"{output_filepath}/mask{t:03}.tif", mask)
+    if tile_shape is None:
+        img = TIFF.imread(in_path)
+        mask = segment_volume(img)
+    else:
+        try:
+            img = TIFF.memmap(in_path, mode='r')  # reads only the currently segmented tile
+        except ValueError:
+            img = TIFF.imread(in_path)            # compressed files can't be memory-mapped
+        mask = segment_tiled(img, segment_volume, tile_shape, tile_overlap)
+
+    write_tiff(out_path, mask, preset=output_preset, atomic=True)
+    manifest.mark_done(out_path, [in_path], manifest_params)
+
+
+if scheduling == 'dynamic':
+    queue = FileClaimQueue(queue_folder, worker_index)
+    queue.populate( f"{tp:03}" for tp in all_jobs_indexes )
+    for item in queue:
+        try:
+            process_time_point(int(item))
+            queue.mark_done(item)
+        except Exception as e:
+            print(f"failed TP = {item}: {e}")
+            queue.mark_failed(item)
+else:
+    this_job_indexes = get_list_of_indices_for_this_worker(worker_index, worker_total, all_jobs_indexes)
+    for t in this_job_indexes:
+        process_time_point(t)
 
@@ -1,18 +1,37 @@
-import tifffile as TIFF
+import os
+import sys
+
+# make the 'util' folder (one level up) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from util.checkpointing import CheckpointManifest
+from util.region_masking import corners_mask, read_yx_shape, apply_region_mask_to_file
+import util.parallelism_paradigms as P
 
 in_folder  = '/mnt/proj2/dd-24-22/Mastodon_paper/orig_as_CTC__1px_markers/SEG_LZWed'
 out_folder = '/mnt/proj2/dd-24-22/Mastodon_paper/orig_as_CTC__own_SEG_TRA/SEG'
 
 cw = 170
-for tp in range(0,601):
-#for tp in range(245,601,5):
-    print("doing tp:",tp)
-    i = TIFF.imread(f"{in_folder}/mask{tp:03}.tif")
+time_points = range(0,601)
+#time_points = range(245,601,5)
+
+# completed time points are recorded here, and skipped when the script is restarted
+manifest = CheckpointManifest(f"{out_folder}/.manifest")
+params = { 'cw': cw }
+
+# encoding of the written masks, see util/tiff_writing.PRESETS ('compatible' is LZW as the inputs)
+output_preset = 'compatible'
 
-    i[:, 0:cw,        0:cw+10] = 0  # TL
-    i[:, 0:cw,         -cw:-1] = 0  # TR
-    i[:, -cw-10:-1,   0:cw+30] = 0  # BL
-    i[:, -cw-10:-1, -cw-10:-1] = 0  # BR
+# the corners are the same for all time points, thus the mask is built just once
+zero_mask = corners_mask(read_yx_shape(f"{in_folder}/mask{time_points[0]:03}.tif"), cw)
 
-    TIFF.imwrite(f"{out_folder}/mask{tp:03}.tif",i)
+def clean_corners(tp):
+    in_path = f"{in_folder}/mask{tp:03}.tif"
+    out_path = f"{out_folder}/mask{tp:03}.tif"
+    if manifest.is_done(out_path, [in_path], params):
+        return "skipped"
+    apply_region_mask_to_file(in_path, out_path, zero_mask, preset=output_preset)
+    manifest.mark_done(out_path, [in_path], params)
+    return "done"
 
+for tp,status in P.process_streaming(time_points, clean_corners, P.get_workers_count(), thread_names="cornersCleaner"):
+    print(f"tp {time_points[tp]}: {status}")
@@ -2,37 +2,113 @@
 """
 Simple TIFF image processor using tifffile
 """
-import tifffile
-import numpy as np
+
+def image_chunks(tif):
+    """
+    Yields the pixels of the first image series of the opened 'tif' page after page,
+    so that not more than one page is held in the memory at any moment.
+    """
+    series = tif.series[0]
+    pages = series.pages
+    if len(pages) <= 1:
+        # a single (maybe multi-sample, e.g. RGB) page, or an image not stored page-wise
+        yield series.asarray()
+        return
+    for page in pages:
+        yield page.asarray()
+
+
+def streaming_statistics(image_path: str) -> dict:
+    """
+    Computes the min, max, mean, std and (for 8- and 16-bit integer images) the histogram
+    of the image at 'image_path' in a single pass over its pages -- the full image is never
+    read into the memory at once. Mean and std are merged chunk after chunk in the numerically
+    stable way (Chan et al.), the histogram is accumulated with 'np.bincount()'.
+
+    Returns:
+        Dictionary with the 'shape', 'dtype', 'count', 'min', 'max', 'mean', 'std' and
+        'histogram' (list of '[value, count]' of the occurring values, or None).
+    """
+    import tifffile
+    import numpy as np
+
+    with tifffile.TiffFile(image_path) as tif:
+        # the shape and dtype come from the metadata only
+        shape = tif.series[0].shape
+        dtype = np.dtype(tif.series[0].dtype)
+
+        with_histogram = dtype.kind in 'ui' and dtype.itemsize <= 2
+        hist_offset = -int(np.iinfo(dtype).min) if with_histogram else 0
+        hist = np.zeros(2**(8*dtype.itemsize), dtype=np.int64) if with_histogram else None
+
+        count, mean, m2 = 0, 0.0, 0.0
+        min_val, max_val = None, None
+        for chunk in image_chunks(tif):
+            chunk = chunk.ravel()
+            if chunk.size == 0: continue
+
+            c_min, c_max = chunk.min(), chunk.max()
+            min_val = c_min if min_val is None else min(min_val, c_min)
+            max_val = c_max if max_val is None else max(max_val, c_max)
+
+            c_mean = chunk.mean(dtype=np.float64)
+            c_m2 = float(np.square(chunk - c_mean).sum())
+            c_count = chunk.size
+            delta = c_mean - mean
+            total = count + c_count
+            mean += delta * c_count / total
+            m2 += c_m2 + delta*delta * count * c_count / total
+            count = total
+
+            if with_histogram:
+                values = chunk.astype(np.int64) + hist_offset if hist_offset else chunk
+                hist += np.bincount(values, minlength=len(hist))
+
+    histogram = None
+    if with_histogram:
+        histogram = [ [int(v)-hist_offset, int(hist[v])] for v in np.flatnonzero(hist) ]
+
+    return { 'shape': list(shape), 'dtype': str(dtype), 'count': count,
+             'min': min_val.item() if min_val is not None else None,
+             'max': max_val.item() if max_val is not None else None,
+             'mean': mean if count > 0 else None,
+             'std': (m2 / count) ** 0.5 if count > 0 else None,
+             'histogram': histogram }
+
 
 def main(image_path: str = '/temp/input.tif'):
+    # imported only here, so that e.g. '--help' is answered without the (slow) imports
+    import json
+
     print(f"Reading TIFF image from: {image_path}")
 
-    # Read the TIFF file
-    image = tifffile.imread(image_path)
+    # One pass over the TIFF file
+    stats = streaming_statistics(image_path)
+    shape = tuple(stats['shape'])
 
-    print(f"Image shape: {image.shape}")
-    print(f"Image dtype: {image.dtype}")
-    print(f"Image min value: {np.min(image)}")
-    print(f"Image max value: {np.max(image)}")
-    print(f"Image mean value: {np.mean(image):.2f}")
+    print(f"Image shape: {shape}")
+    print(f"Image dtype: {stats['dtype']}")
+    print(f"Image min value: {stats['min']}")
+    print(f"Image max value: {stats['max']}")
+    print(f"Image mean value: {stats['mean']:.2f}")
+    print(f"Image std value: {stats['std']:.2f}")
 
     # Do some simple processing
-    if len(image.shape) == 2:
+    if len(shape) == 2:
         # Grayscale image
         print("\nThis is a grayscale image")
-        height, width = image.shape
+        height, width = shape
         print(f"Dimensions: {width} x {height} pixels")
-    elif len(image.shape) == 3:
+    elif len(shape) == 3:
         # Color or multi-channel image
-        if image.shape[2] <= 4:
+        if shape[2] <= 4:
             # Likely RGB or RGBA
-            print(f"\nThis is a color image with {image.shape[2]} channels")
-            height, width, channels = image.shape
+            print(f"\nThis is a color image with {shape[2]} channels")
+            height, width, channels = shape
             print(f"Dimensions: {width} x {height} pixels, {channels} channels")
         else:
             # Multi-page or z-stack
-            print(f"\nThis is a multi-page/z-stack image with {image.shape[0]} slices")
+            print(f"\nThis is a multi-page/z-stack image with {shape[0]} slices")
 
     # Write some output
     output_path = "/temp/output.txt"
@@ -40,20 +116,28 @@ def main(image_path: str = '/temp/input.tif'):
         f.write(f"Image Analysis Results\n")
         f.write(f"=====================\n")
         f.write(f"Input file: {image_path}\n")
-        f.write(f"Shape: {image.shape}\n")
-        f.write(f"Data type: {image.dtype}\n")
-        f.write(f"Min: {np.min(image)}\n")
-        f.write(f"Max: {np.max(image)}\n")
-        f.write(f"Mean: {np.mean(image):.2f}\n")
+        f.write(f"Shape: {shape}\n")
+        f.write(f"Data type: {stats['dtype']}\n")
+        f.write(f"Min: {stats['min']}\n")
+        f.write(f"Max: {stats['max']}\n")
+        f.write(f"Mean: {stats['mean']:.2f}\n")
+        f.write(f"Std: {stats['std']:.2f}\n")
+
+    # the same (and the histogram) machine-readable, for aggregating over many files
+    json_path = "/temp/output.json"
+    with open(json_path, 'w') as f:
+        json.dump({ 'input_file': image_path, **stats }, f)
 
-    print(f"\nResults written to: {output_path}")
+    print(f"\nResults written to: {output_path} and {json_path}")
     print("Processing complete!")
 
 
 if __name__ == "__main__":
     import sys
     print(f"args: {sys.argv}")
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 1 and sys.argv[1] in ['-h', '--help']:
+        print(f"Usage: {sys.argv[0]} [image_path]   (default: /temp/input.tif)")
+    elif len(sys.argv) > 1:
         main(sys.argv[1])
     else:
         main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Per-label intensity and shape measurements of raw+mask image pairs
+"""
+import os
+
+# columns that are always measured (with the 'np.bincount()' and the 'scipy.ndimage' functions),
+# the optional shape features are measured with the 'skimage.measure.regionprops_table()'
+BASIC_FEATURES = ['area', 'intensity_sum', 'intensity_mean', 'intensity_std', 'intensity_min', 'intensity_max']
+SHAPE_FEATURES = ['eccentricity', 'solidity', 'extent', 'axis_major_length', 'axis_minor_length']
+
+
+def measure_labels(raw_img, mask_img, shape_features: bool = False) -> dict:
+    """
+    Measures all labels of the 'mask_img' at once -- there's no loop over the labels,
+    every feature is computed with a single (vectorized) pass over the images.
+
+    Returns:
+        Dictionary of columns (1D numpy arrays of the same length, one item per label):
+        'label', the BASIC_FEATURES, the 'centroid_<axis>' and 'bbox_<axis>_min/max'
+        for every image axis, and the SHAPE_FEATURES if 'shape_features' is set
+        (2D images only for some of them).
+    """
+    import numpy as np
+    import scipy.ndimage as ndi
+
+    if raw_img.shape != mask_img.shape:
+        raise ValueError(f"raw image {raw_img.shape} and mask {mask_img.shape} differ in shape")
+
+    lbl = mask_img.ravel().astype(np.int64, copy=False)
+    val = raw_img.ravel().astype(np.float64, copy=False)
+    area = np.bincount(lbl)
+    labels = np.flatnonzero(area)
+    labels = labels[labels > 0]                 # 0 is the background
+    area = area[labels]
+
+    sums = np.bincount(lbl, weights=val)[labels]
+    means = sums / area
+    sq_sums = np.bincount(lbl, weights=val*val)[labels]
+    stds = np.sqrt(np.maximum(sq_sums/area - means*means, 0.0))
+
+    columns = { 'label': labels.astype(np.int64), 'area': area.astype(np.int64),
+                'intensity_sum': sums, 'intensity_mean': means, 'intensity_std': stds,
+                'intensity_min': np.asarray(ndi.minimum(raw_img, mask_img, labels), dtype=np.float64),
+                'intensity_max': np.asarray(ndi.maximum(raw_img, mask_img, labels), dtype=np.float64) }
+
+    axes = 'zyx'[-raw_img.ndim:] if raw_img.ndim <= 3 else [ f"ax{i}" for i in range(raw_img.ndim) ]
+    for a,axis in enumerate(axes):
+        coord_shape = [1]*raw_img.ndim
+        coord_shape[a] = raw_img.shape[a]
+        coords = np.broadcast_to(np.arange(raw_img.shape[a]).reshape(coord_shape), raw_img.shape).ravel()
+        columns[f"centroid_{axis}"] = np.bincount(lbl, weights=coords)[labels] / area
+
+    # one bounding box per label value, None for the values that do not occur
+    boxes = ndi.find_objects(mask_img.astype(np.int64, copy=False))
+    for a,axis in enumerate(axes):
+        columns[f"bbox_{axis}_min"] = np.array([ boxes[l-1][a].start for l in labels ], dtype=np.int64)
+        columns[f"bbox_{axis}_max"] = np.array([ boxes[l-1][a].stop for l in labels ], dtype=np.int64)
+
+    if shape_features:
+        from skimage.measure import regionprops_table
+        props = ['label'] + (SHAPE_FEATURES if raw_img.ndim == 2 else ['extent', 'axis_major_length', 'axis_minor_length'])
+        table = regionprops_table(mask_img.astype(np.int64, copy=False), properties=props)
+        # regionprops_table() lists the labels sorted as well
+        for name in props[1:]:
+            columns[name] = np.asarray(table[name], dtype=np.float64)
+
+    return columns
+
+
+def measure_pair(time_point: int, image_path: str, label_path: str, shape_features: bool = False) -> dict:
+    """
+    Reads one raw+mask pair and measures it, see 'measure_labels()'. The columns 'time_point'
+    and 'image' are added to identify the rows in the (concatenated) output table.
+    """
+    import numpy as np
+    import tifffile
+
+    columns = measure_labels(tifffile.imread(image_path), tifffile.imread(label_path), shape_features)
+    n = len(columns['label'])
+    return { 'time_point': np.full(n, time_point, dtype=np.int64),
+             'image': [ os.path.basename(image_path) ]*n,
+             **columns }
+
+
+class TableWriter:
+    """
+    Appends tables (given as dictionaries of columns) one after another to the 'path' file,
+    as 'parquet' or 'feather' (with pyarrow; one row group/record batch per appended table),
+    or as 'csv' -- the output table is never held in the memory as a whole.
+    """
+    def __init__(self, path: str, file_format: str = 'parquet'):
+        self.path = path
+        self.file_format = file_format
+        self._writer = None
+        self._file = None
+
+    def write(self, columns: dict):
+        if len(next(iter(columns.values()))) == 0:
+            return      # nothing to append, and the column types of an empty table are unknown
+        if self.file_format == 'csv':
+            self._write_csv(columns)
+            return
+
+        import pyarrow as pa
+        table = pa.table(columns)
+        if self._writer is None:
+            if self.file_format == 'parquet':
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            elif self.file_format == 'feather':
+                # Feather (v2) is the Arrow IPC file format
+                self._writer = pa.ipc.new_file(self.path, table.schema)
+            else:
+                raise ValueError(f"unknown output format '{self.file_format}'")
+        self._writer.write_table(table)
+
+    def _write_csv(self, columns: dict):
+        import csv
+        if self._file is None:
+            self._file = open(self.path, 'w', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(columns.keys())
+        self._writer.writerows(zip(*columns.values()))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        elif self._writer is not None:
+            self._writer.close()
+        self._writer, self._file = None, None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def list_pairs(image_dir: str, label_dir: str, label_suffix: str = '_mask'):
+    """
+    Pairs every '*.tif(f)' image of the 'image_dir' with its mask of the same name
+    with the 'label_suffix' (e.g. '604_img.tif' with '604_img_mask.tif') from the 'label_dir'.
+    Images without a mask are reported and skipped.
+
+    Returns:
+        List of '(image_path, label_path)', sorted (naturally, if 'natsort' is available) by the image names.
+    """
+    import glob
+    try:
+        from natsort import natsorted
+    except ImportError:
+        natsorted = sorted
+
+    pairs = []
+    for image_path in natsorted(glob.glob(os.path.join(image_dir, '*.tif')) + glob.glob(os.path.join(image_dir, '*.tiff'))):
+        stem, ext = os.path.splitext(os.path.basename(image_path))
+        if stem.endswith(label_suffix) and os.path.abspath(image_dir) == os.path.abspath(label_dir):
+            continue    # a mask itself, when images and masks share one folder
+        label_path = os.path.join(label_dir, stem + label_suffix + ext)
+        if not os.path.exists(label_path):
+            print(f"skipping {image_path}, no mask {label_path} found")
+            continue
+        pairs.append((image_path, label_path))
+    return pairs
+
+
+def measure_pairs(pairs, output_path: str, file_format: str = 'parquet', workers: int = 1, shape_features: bool = False) -> int:
+    """
+    Measures the raw+mask 'pairs' with 'N = workers' processes in parallel (one time point
+    per task), and streams the rows into the 'output_path' in the order of the 'pairs'.
+
+    Returns:
+        The number of written rows (measured labels).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    rows = 0
+    with TableWriter(output_path, file_format) as writer:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(measure_pair, range(len(pairs)), *zip(*pairs), [shape_features]*len(pairs))
+                for (image_path,_),columns in zip(pairs, results):
+                    writer.write(columns)
+                    rows += len(columns['label'])
+                    print(f"measured {len(columns['label'])} labels in {image_path}")
+        else:
+            for time_point,(image_path,label_path) in enumerate(pairs):
+                columns = measure_pair(time_point, image_path, label_path, shape_features)
+                writer.write(columns)
+                rows += len(columns['label'])
+                print(f"measured {len(columns['label'])} labels in {image_path}")
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Per-label measurements of raw images within their masks.")
+    parser.add_argument('--image_path', help="a single raw image to measure")
+    parser.add_argument('--label_path', help="the mask of the single raw image")
+    parser.add_argument('--image_dir', help="folder mode: folder with the raw images (*.tif, *.tiff)")
+    parser.add_argument('--label_dir', help="folder mode: folder with the masks (default: the 'image_dir')")
+    parser.add_argument('--label_suffix', default='_mask', help="folder mode: the mask of 'X.tif' is 'X<suffix>.tif' (default: %(default)s)")
+    parser.add_argument('--output_dir', default='.', help="where to write the table (default: %(default)s)")
+    parser.add_argument('--format', default='parquet', choices=['parquet', 'feather', 'csv'], help="output table format (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=1, help="folder mode: number of time points measured in parallel (default: %(default)s)")
+    parser.add_argument('--shape_features', action='store_true', help="measure also "+', '.join(SHAPE_FEATURES))
+    args = parser.parse_args()
+
+    if args.image_dir:
+        pairs = list_pairs(args.image_dir, args.label_dir or args.image_dir, args.label_suffix)
+        output_name = "metrics"
+    elif args.image_path and args.label_path:
+        pairs = [(args.image_path, args.label_path)]
+        output_name = os.path.splitext(os.path.basename(args.image_path))[0] + "_metrics"
+    else:
+        parser.error("either '--image_dir', or both '--image_path' and '--label_path' must be given")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"{output_name}.{args.format}")
+    rows = measure_pairs(pairs, output_path, args.format, args.workers, args.shape_features)
+    print(f"{rows} rows from {len(pairs)} image(s) written to: {output_path}")
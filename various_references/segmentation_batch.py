@@ -0,0 +1,93 @@
+import os
+import time
+import glob
+import argparse
+
+# Batched segmentation: several 2D images of the same shape are stacked into one
+# (N,Y,X) array and handed over to Cellpose in one 'model.eval()' call as a stack of
+# 2D planes (NB: a python list would be evaluated image after image). The tiles of all
+# planes are then pushed through the network together, 'batch_size' tiles per one pass,
+# which pays off on multi-core CPUs (and GPUs) where per-call overheads otherwise dominate.
+# The images are given as a list of files (or glob patterns), and the throughput of
+# every stack is reported to help tuning the stack size, the batch size and the number
+# of torch threads for a particular node type.
+#
+# HOW TO RUN, example:
+#   python segmentation_batch.py --file_list files.txt --output_folder masks --stack_size 16 --batch_size 32 --torch_threads 16
+#   python segmentation_batch.py --output_folder masks --stack_size 16 'inputs/t*.tif'
+
+
+def read_file_list(file_list_path: str, patterns: list) -> list:
+    paths = []
+    if file_list_path:
+        with open(file_list_path, 'r') as f:
+            paths += [ line.strip() for line in f if line.strip() and not line.startswith('#') ]
+    for pattern in patterns:
+        paths += sorted(glob.glob(pattern))
+    return paths
+
+
+def read_stacks(paths: list, stack_size: int):
+    """
+    Yields '(stack_paths, stack)' where 'stack' is an (N,Y,X) array of not more than
+    'stack_size' consecutive images of the 'paths' that are all of the same shape.
+    """
+    import numpy as np
+    import tifffile as TIFF
+
+    stack_paths, stack_imgs = [], []
+    for p in paths:
+        img = TIFF.imread(p)
+        if img.ndim != 2: raise ValueError(f"{p} is not a 2D image, but of shape {img.shape}")
+        if len(stack_imgs) > 0 and (img.shape != stack_imgs[0].shape or len(stack_imgs) == stack_size):
+            yield stack_paths, np.stack(stack_imgs)
+            stack_paths, stack_imgs = [], []
+        stack_paths.append(p)
+        stack_imgs.append(img)
+    if len(stack_imgs) > 0:
+        yield stack_paths, np.stack(stack_imgs)
+
+
+def segment_in_batches(paths: list, output_folder: str, stack_size: int, batch_size: int, torch_threads: int, cellpose_version: int):
+    import torch
+    from cellpose import models
+    import tifffile as TIFF
+
+    if torch_threads > 0: torch.set_num_threads(torch_threads)
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    print(f"Will use: {device} with {torch.get_num_threads()} threads")
+    model = models.Cellpose(device=device) if cellpose_version == 3 else models.CellposeModel(device=device)
+
+    os.makedirs(output_folder, exist_ok=True)
+    total_start = time.time()
+    for s,(stack_paths,stack) in enumerate(read_stacks(paths, stack_size)):
+        start = time.time()
+        # the stack as 2D planes (z_axis=0, no 3D nor stitching), 'batch_size' tiles per network pass
+        masks = model.eval(stack, z_axis=0, channel_axis=None, do_3D=False, stitch_threshold=0.0,
+                           batch_size=batch_size, normalize=True, niter=2000)[0]  # cp3 returns four items, cp4 three
+        seconds = time.time() - start
+
+        for p,mask in zip(stack_paths, masks):
+            TIFF.imwrite(os.path.join(output_folder, os.path.splitext(os.path.basename(p))[0] + "_masks.tif"), mask)
+
+        print(f"stack {s+1}: {len(stack_paths)} images in {seconds:.2f} s, "
+              f"that is {len(stack_paths)/seconds:.2f} images/s and {stack.size/1e6/seconds:.2f} Mpx/s")
+
+    seconds = time.time() - total_start
+    print(f"all {len(paths)} images in {seconds:.2f} s, that is {len(paths)/seconds:.2f} images/s (incl. reading and writing)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Batched Cellpose segmentation of many 2D images.")
+    parser.add_argument('patterns', nargs='*', help="glob patterns of the input images")
+    parser.add_argument('--file_list', help="text file with one input image path per line")
+    parser.add_argument('--output_folder', required=True, help="where the '*_masks.tif' are written")
+    parser.add_argument('--stack_size', type=int, default=8, help="max. number of (same-shaped) images stacked into one eval() call")
+    parser.add_argument('--batch_size', type=int, default=8, help="number of tiles per one network pass, Cellpose's eval(batch_size=...)")
+    parser.add_argument('--torch_threads', type=int, default=0, help="number of torch CPU threads (0: torch's default)")
+    parser.add_argument('--cellpose', type=int, choices=[3, 4], default=4, help="version of Cellpose")
+    args = parser.parse_args()
+
+    paths = read_file_list(args.file_list, args.patterns)
+    if len(paths) == 0: parser.error("no input images given")
+    segment_in_batches(paths, args.output_folder, max(1, args.stack_size), max(1, args.batch_size), args.torch_threads, args.cellpose)
@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+
+# A long-lived segmentation worker: the Cellpose model (and torch) is loaded once,
+# and then many segmentation requests are served over a Unix socket, so that
+# a request costs only the inference itself (plus reading and writing the files).
+#
+# HOW TO RUN, example:
+#   python segmentation_server.py serve --socket /tmp/cellpose.sock &
+#   python segmentation_server.py segment --socket /tmp/cellpose.sock in1.tif out1.tif in2.tif out2.tif
+#   python segmentation_server.py stop --socket /tmp/cellpose.sock
+#
+# The protocol is one JSON object per line in both directions, a request:
+#   {"cmd": "segment", "input": "in.tif", "output": "out.tif", "eval_params": {...}}
+#   {"cmd": "stop"}
+# and a reply:
+#   {"status": "OK", "seconds": 1.23}  or  {"status": "FAIL", "error": "..."}
+#
+# NB: the client part imports no heavy modules, and only the server needs torch and cellpose
+
+
+default_eval_params = dict(normalize=True, do_3D=False, niter=2000)
+
+
+def serve(socket_path: str, cellpose_version: int):
+    import torch
+    from cellpose import models
+    import tifffile as TIFF
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    print(f"Will use: {device}")
+    model = models.Cellpose(device=device) if cellpose_version == 3 else models.CellposeModel(device=device)
+
+    if os.path.exists(socket_path): os.remove(socket_path)  # a stale one from a previous run
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    print(f"Serving on: {socket_path}")
+
+    def handle(line: str) -> dict:
+        # every request gets a reply, also a malformed one
+        try:
+            request = json.loads(line)
+            start = time.time()
+            img = TIFF.imread(request['input'])
+            eval_params = { **default_eval_params, **request.get('eval_params', {}) }
+            mask = model.eval(img, **eval_params)[0]  # cp3 returns four items, cp4 three
+            TIFF.imwrite(request['output'], mask)
+            reply = {'status': 'OK', 'seconds': time.time() - start}
+            print(f"segmented {request['input']} in {reply['seconds']:.2f} s")
+        except Exception as e:
+            reply = {'status': 'FAIL', 'error': str(e)}
+            print(f"failed request {line.strip()}: {e}")
+        return reply
+
+    keep_serving = True
+    try:
+        while keep_serving:
+            conn,_ = server.accept()
+            try:
+                with conn, conn.makefile('r') as requests, conn.makefile('w') as replies:
+                    for line in requests:
+                        if is_stop_request(line):
+                            reply = {'status': 'OK'}
+                            keep_serving = False
+                        else:
+                            reply = handle(line)
+                        replies.write(json.dumps(reply) + "\n")
+                        replies.flush()
+                        if not keep_serving: break
+            except (BrokenPipeError, ConnectionResetError) as e:
+                # the client has gone away, the server stays for the others
+                print(f"client disconnected: {e}")
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+
+def is_stop_request(line: str) -> bool:
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return False
+    return isinstance(request, dict) and request.get('cmd') == 'stop'
+
+
+def connect(socket_path: str, wait_seconds: float = 0) -> socket.socket:
+    """
+    Returns a connection to the server, waits up to 'wait_seconds' for the server
+    to appear (e.g. while it's still loading the model).
+    """
+    waiting_since = time.time()
+    while True:
+        try:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.connect(socket_path)
+            return conn
+        except (FileNotFoundError, ConnectionRefusedError):
+            conn.close()
+            if time.time() - waiting_since > wait_seconds: raise
+            time.sleep(0.5)
+
+
+def send_requests(socket_path: str, requests: list, wait_seconds: float = 0) -> list:
+    """
+    Sends the 'requests' (dicts, see above) over one connection, and returns the server's replies.
+    """
+    replies = []
+    with connect(socket_path, wait_seconds) as conn, conn.makefile('r') as conn_in, conn.makefile('w') as conn_out:
+        for request in requests:
+            conn_out.write(json.dumps(request) + "\n")
+            conn_out.flush()
+            replies.append(json.loads(conn_in.readline()))
+    return replies
+
+
+def segment(socket_path: str, in_out_paths: list, eval_params: dict = {}, wait_seconds: float = 0) -> list:
+    """
+    Asks the server to segment each 'input' into 'output', where 'in_out_paths' is a list of such pairs.
+    """
+    requests = [ {'cmd': 'segment', 'input': os.path.abspath(i), 'output': os.path.abspath(o), 'eval_params': eval_params}
+                 for i,o in in_out_paths ]
+    return send_requests(socket_path, requests, wait_seconds)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Persistent Cellpose segmentation server, and its client.")
+    parser.add_argument('command', choices=['serve', 'segment', 'stop'])
+    parser.add_argument('paths', nargs='*', help="pairs of input and output image paths (for 'segment')")
+    parser.add_argument('--socket', default='/tmp/cellpose_server.sock', help="path of the Unix socket")
+    parser.add_argument('--cellpose', type=int, choices=[3, 4], default=4, help="version of Cellpose (for 'serve')")
+    parser.add_argument('--eval_params', default='{}', help="JSON dict of extra model.eval() parameters (for 'segment')")
+    parser.add_argument('--wait', type=float, default=60, help="seconds to wait for the server to come up")
+    args = parser.parse_intermixed_args()
+
+    if args.command == 'serve':
+        serve(args.socket, args.cellpose)
+    elif args.command == 'stop':
+        send_requests(args.socket, [{'cmd': 'stop'}], args.wait)
+    else:
+        if len(args.paths) == 0 or len(args.paths) % 2 != 0:
+            parser.error("'segment' needs pairs of input and output paths")
+        pairs = list(zip(args.paths[0::2], args.paths[1::2]))
+        failed = 0
+        for (i,o),reply in zip(pairs, segment(args.socket, pairs, json.loads(args.eval_params), args.wait)):
+            print(i, "->", o, ":", reply)
+            if reply['status'] != 'OK': failed += 1
+        sys.exit(1 if failed > 0 else 0)
@@ -0,0 +1,21 @@
+import os
+import numpy as np
+import util.array_cache as AC
+
+
+def test_put_scans_only_when_the_limit_is_passed(tmp_path, monkeypatch):
+    scans = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(AC.os, 'scandir', lambda path: scans.append(path) or real_scandir(path))
+
+    array = np.zeros(1000, dtype=np.uint8)
+    entry_bytes = 1000 + 128   # the '.npy' header
+    cache = AC.ArrayCache(str(tmp_path), max_bytes=20 * entry_bytes)
+    for i in range(100):
+        cache.put(f"k{i}", array)
+
+    # the first put, and then once per the 10 % of the limit (2 entries) written beyond it
+    assert len(scans) <= 1 + (100 - 20) // 2
+    stored = [ n for n in os.listdir(tmp_path) if n.endswith('.npy') ]
+    assert 0 < len(stored) <= 20
+    assert cache.get("k99") is not None and cache.get("k0") is None
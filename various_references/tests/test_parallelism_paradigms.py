@@ -0,0 +1,64 @@
+import threading
+import concurrent.futures
+import pytest
+import util.parallelism_paradigms as P
+
+
+def simulate_saturating_load(monkeypatch, tuner, items: int, knee: int = 4, rate_per_worker: float = 2.0):
+    # simulated clock: the workers finish items ever faster up to the 'knee', beyond it (e.g. the disk
+    # is saturated) the additional workers bring nothing; returns the index of the item after which
+    # the tuner has settled at the knee for good
+    clock = [0.0]
+    monkeypatch.setattr(P.time, 'perf_counter', lambda: clock[0])
+    settled_at = None
+    for i in range(items):
+        clock[0] += 1.0 / (rate_per_worker * min(tuner.limit, knee))
+        tuner.task_done()
+        if tuner.best_limit != knee: settled_at = None
+        elif settled_at is None: settled_at = i
+    return settled_at
+
+
+def test_tuner_finds_the_knee_within_bounded_items(monkeypatch):
+    for initial_limit,max_limit in [(1, 64), (4, 64), (8, 16), (32, 64)]:
+        tuner = P.ConcurrencyTuner(max_limit, initial_limit=initial_limit)
+        settled_at = simulate_saturating_load(monkeypatch, tuner, 1000)
+        # a few hundred frames must suffice, the windows must not grow with the number of workers
+        assert settled_at is not None and settled_at < 300, (initial_limit, max_limit, settled_at)
+        assert abs(tuner.limit - 4) <= 1
+
+
+def test_tuner_skips_the_window_after_a_change(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(P.time, 'perf_counter', lambda: clock[0])
+    tuner = P.ConcurrencyTuner(8, initial_limit=1, min_window_seconds=1.0)
+
+    def finish(items: int):
+        for _ in range(items):
+            clock[0] += 0.25
+            tuner.task_done()
+
+    finish(1 + 4)       # the window starts with the first finished item
+    assert len(tuner.history) == 1 and tuner.limit != 1
+    finish(4)           # still (partly) the work started with 1 worker
+    assert len(tuner.history) == 1
+    finish(4)
+    assert len(tuner.history) == 2 and tuner.history[1][0] != 1
+
+
+def test_streaming_timeout_yields_the_finished_and_raises():
+    release = threading.Event()
+
+    def work(i):
+        if i == 0: release.wait(10)   # the first item gets stuck
+        return i*10
+
+    received = []
+    try:
+        with pytest.raises(concurrent.futures.TimeoutError):
+            for idx,o in P.process_streaming(range(3), work, num_workers=3, ordered=True, timeout=0.3):
+                received.append((idx, o))
+    finally:
+        release.set()
+    # the outputs waiting behind the stuck one are not lost
+    assert received == [(1, 10), (2, 20)]
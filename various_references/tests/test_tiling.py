@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from util.tiling import tile_slices, segment_tiled
+
+
+def test_axis_shorter_than_overlap_is_one_tile():
+    # 10 z-slices with the overlap of 16 (and the tile of 64): one tile along z, no overlap needed
+    tiles = tile_slices((10, 100, 100), (64, 60, 60), (16, 8, 8))
+    assert sorted({ (t[0].start, t[0].stop) for t in tiles }) == [(0, 10)]
+    assert sorted({ (t[1].start, t[1].stop) for t in tiles }) == [(0, 60), (52, 100)]
+
+
+def test_overlap_not_smaller_than_tile_is_refused():
+    with pytest.raises(ValueError):
+        tile_slices((100,), (16,), (16,))
+
+
+def test_segment_tiled_with_short_axis():
+    volume = np.zeros((4, 40, 40), dtype=np.uint8)
+    volume[:, 5:15, 5:15] = 1
+    volume[:, 20:35, 18:30] = 1
+    labels = segment_tiled(volume, lambda tile: (tile > 0).astype(np.uint32) * 7, (64, 24, 24), (16, 8, 8))
+    assert labels.shape == volume.shape
+    assert ((labels > 0) == (volume > 0)).all()
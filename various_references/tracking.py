@@ -1,11 +1,14 @@
-import torch
+import os
 import numpy as np
-from trackastra.model import Trackastra
-from trackastra.tracking import graph_to_ctc, graph_to_napari_tracks
-from trackastra.data import example_data_bacteria
 import tifffile as TIFF
 from skimage.transform import resize as img_resize
 import util.parallelism_paradigms as P
+import util.instrumentation as I
+from util.timeseries_store import TimeSeriesStore
+from util.array_cache import ArrayCache
+from util.label_scaling import downscale_labels, upscale_labels
+from util.relabeling import build_label_lut, apply_label_lut
+from util.tiff_writing import write_tiff
 
 device = "automatic" # explicit choices: [cuda, mps, cpu]
 
@@ -16,12 +19,19 @@ downscale_z = 1.0
 
 orig_shape = None
 
+# encoding of the written man_track*.tif files, see util/tiff_writing.PRESETS
+output_preset = 'fastest'
+
+# masks are down-scaled in their native dtype with util/label_scaling (when the factors are integers):
+# 'nearest' or 'mode' (most frequent label in the block), and no mask disappears if the flag is set
+mask_downscale_reducer = 'nearest'
+mask_downscale_keep_all_labels = True
+
 # TODO: after down-scaling, check that
-#         - no mask disappeared; if it did disappeared, place 1x1 px at least
 #         - no mask has been split into multiple components (or(?), to different number of components than it was originally)
 
-# TODO: instead of up-scaling back, relabel the original masks (reload them from the drive)
-# TODO: after up-scaling/projecting back, check no label has been left untouched (consistency)
+# NB: instead of up-scaling back, the original masks are reloaded from the drive and relabeled,
+#     see relabel_original_mask() -- its report lists the labels left untouched (consistency)
 
 # TODO: towards automation:
 #         - use ~1.0x number of CPUs for the multithreading
@@ -29,12 +39,17 @@ orig_shape = None
 #         - consider using TQDM in util/parallelism_paradigms (and not print() in processing functions)
 #         - for segmentation: use SLURM env variables (with defaults if no env var is found) for splitting the work
 
+@I.spanned('downscale')
 def downscaled_in_xyz(img, is_mask=False):
     global orig_shape
     sz_new = []
     sz_orig = img.shape
     orig_shape = [ sz for sz in sz_orig ] # backup (make a copy) the original size, assuming all input images are of the same size
 
+    factors = [downscale_z, downscale_y, downscale_x][-len(sz_orig):]
+    if is_mask and len(sz_orig) <= 3 and all(float(f).is_integer() for f in factors):
+        return downscale_labels(img, factors, reducer=mask_downscale_reducer, keep_all_labels=mask_downscale_keep_all_labels)
+
     if len(sz_orig) > 2: sz_new.append( int(sz_orig[-3] // downscale_z) )
     sz_new.append( int(sz_orig[-2] // downscale_y) )
     sz_new.append( int(sz_orig[-1] // downscale_x) )
@@ -43,13 +58,39 @@ def downscaled_in_xyz(img, is_mask=False):
 def upscaled_in_xyz(img, is_mask=False):
     global orig_shape
     if orig_shape is None: return img
-    return img_resize(img, orig_shape, preserve_range=True, order=0) if is_mask else img_resize(img, orig_shape, preserve_range=True)
+    if is_mask: return upscale_labels(img, orig_shape)
+    return img_resize(img, orig_shape, preserve_range=True)
 
-def read_and_downscale(img_filepath, is_mask=False):
-    return downscaled_in_xyz( TIFF.imread(img_filepath), is_mask=is_mask )
+# persistent cache of the read_and_downscale() results, useful when the tracking
+# is re-run (e.g. with different modes) on the same inputs; None disables it
+downscale_cache = None
+#downscale_cache = ArrayCache('./downscale_cache', max_bytes=50 << 30)
+
+@I.spanned('read')
+def read_tiff(img_filepath):
+    return TIFF.imread(img_filepath)
 
+def read_and_downscale(img_filepath, is_mask=False):
+    global orig_shape
+    if downscale_cache is None:
+        return downscaled_in_xyz( read_tiff(img_filepath), is_mask=is_mask )
+
+    # the masks depend also on how they are downscaled (the raw images do not)
+    mask_params = { 'reducer': mask_downscale_reducer, 'keep_all_labels': mask_downscale_keep_all_labels } if is_mask else {}
+    key = ArrayCache.key_for(img_filepath, downscale_xyz=[downscale_x, downscale_y, downscale_z], is_mask=is_mask, **mask_params)
+    img = downscale_cache.get(key)
+    if img is None:
+        img = downscaled_in_xyz( read_tiff(img_filepath), is_mask=is_mask )
+        downscale_cache.put(key, img)
+    else:
+        # the original size is otherwise learned only while downscaling
+        with TIFF.TiffFile(img_filepath) as tif:
+            orig_shape = list(tif.series[0].shape)
+    return img
+
+@I.spanned('write')
 def write_upscaled(img_filepath, img, is_mask=False):
-    TIFF.imwrite( img_filepath, upscaled_in_xyz(img, is_mask=is_mask) )
+    write_tiff( img_filepath, upscaled_in_xyz(img, is_mask=is_mask), preset=output_preset )
 
 
 def load_ctc(from_folder, tp_range_from, tp_range_till):
@@ -85,10 +126,11 @@ def load_ctc_worker(input_tuple):
     imgs[idx] = read_and_downscale(path, is_mask=is_mask)
     return "OK" # flag the job is done
 
-NUM_PARALLEL_WORKERS = 50
+# the multi-process loader (reading and downscaling) gets one process per available CPU;
+# the threaded loaders and the writer tune their count of threads while they run,
+# as it is not known upfront how much I/O-bound (vs. CPU-bound) the work is
+NUM_PARALLEL_WORKERS = P.get_workers_count()
 def load_ctc_with_multiprocessing(from_folder, tp_range_from, tp_range_till):
-    global NUM_PARALLEL_WORKERS
-
     # load the first image to understand the shape
     fp = f"{from_folder}/t{tp_range_from:03}.tif"
     print("reading the first raw file:",fp)
@@ -101,55 +143,197 @@ def load_ctc_with_multiprocessing(from_folder, tp_range_from, tp_range_till):
     print("...this is likely as much as",len(imgs.flat)*4.0 / float(1 << 30),"GB")
     imgs[0] = i
 
+    # the masks are loaded starting from the threads count found for the raw images
+    tuner = P.ConcurrencyTuner(P.get_workers_count(4.0))
     tasks = [ (imgs,tp-tp_range_from,f"{from_folder}/t{tp:03}.tif",False) for tp in range(tp_range_from+1, tp_range_till+1) ]
-    P.process_with_multithreading(tasks, load_ctc_worker, NUM_PARALLEL_WORKERS, "ctc_loader")
+    for _ in P.process_adaptive(tasks, load_ctc_worker, thread_names="ctc_loader", ordered=False, tuner=tuner): pass
 
     print("reading the masks now")
     tasks = [ (masks,tp-tp_range_from,f"{from_folder}/SEG/mask{tp:03}.tif",True) for tp in range(tp_range_from, tp_range_till+1) ]
-    P.process_with_multithreading(tasks, load_ctc_worker, NUM_PARALLEL_WORKERS, "ctc_loader")
+    for _ in P.process_adaptive(tasks, load_ctc_worker, thread_names="ctc_loader", ordered=False, tuner=tuner): pass
 
     print("done reading.")
     return imgs,masks
 ## </ parallel version of load_ctc() >
 
 
-# load some test data images and masks
-# imgs, masks = example_data_bacteria()
+## <  multi-process version of load_ctc() >
+def read_and_downscale_worker(input_tuple):
+    path,is_mask = input_tuple
+    print("reading file :",path)
+    return read_and_downscale(path, is_mask=is_mask)
 
-#imgs, masks = load_ctc('/mnt/proj2/dd-24-22/Mastodon_paper/orig_as_CTC__own_SEG_TRA/',0,600)
-imgs, masks = load_ctc_with_multiprocessing('/mnt/proj2/dd-24-22/Mastodon_paper/orig_as_CTC__own_SEG_TRA/',0,600)
+# the shared memory blocks behind the arrays returned from load_ctc_with_shared_memory(),
+# they have to be kept referenced while the arrays are in use, and unlinked at the end
+shared_arrays = []
 
-# Load a pretrained model
-#model = Trackastra.from_pretrained("general_2d", device=device)
-#
-# the 'ctc' model handles also 2d tracking
-model = Trackastra.from_pretrained('ctc', device=device)
+def load_ctc_with_shared_memory(from_folder, tp_range_from, tp_range_till):
+    global NUM_PARALLEL_WORKERS, shared_arrays
 
-print("starting the tracking...")
+    # load the first image to understand the shape
+    fp = f"{from_folder}/t{tp_range_from:03}.tif"
+    print("reading the first raw file:",fp)
+    i = read_and_downscale(fp, is_mask=False)
 
-# Track the cells
-track_graph = model.track(imgs, masks, mode="greedy")  # or mode="ilp", or "greedy_nodiv"
+    tp_range = tp_range_till - tp_range_from +1
+    shared_imgs = P.SharedNDArray([tp_range,*i.shape], dtype=i.dtype)
+    shared_masks = P.SharedNDArray([tp_range,*i.shape], dtype='uint16')
+    shared_arrays += [shared_imgs, shared_masks]
+    imgs,masks = shared_imgs.array, shared_masks.array
+    print("allocated shared memory for twice the shapes:",imgs.shape)
+    print("...this is likely as much as",len(imgs.flat)*4.0 / float(1 << 30),"GB")
+    imgs[0] = i
 
-print("done tracking.")
+    # the workers decode and resize on their own cores, and write directly into the shared arrays
+    tasks = [ (tp-tp_range_from, (f"{from_folder}/t{tp:03}.tif",False)) for tp in range(tp_range_from+1, tp_range_till+1) ]
+    P.process_with_multiprocessing(tasks, read_and_downscale_worker, NUM_PARALLEL_WORKERS, into_shared_array=shared_imgs)
 
-# Write to cell tracking challenge format
-ctc_tracks, masks_tracked = graph_to_ctc(track_graph, masks, outdir=".")
+    print("reading the masks now")
+    tasks = [ (tp-tp_range_from, (f"{from_folder}/SEG/mask{tp:03}.tif",True)) for tp in range(tp_range_from, tp_range_till+1) ]
+    P.process_with_multiprocessing(tasks, read_and_downscale_worker, NUM_PARALLEL_WORKERS, into_shared_array=shared_masks)
 
-print("done exporting (1st pass)")
+    print("done reading.")
+    return imgs,masks
+## </ multi-process version of load_ctc() >
 
-# hmm, but it is written with "ZSTD compression".... a bit of problem
-# soo, resave again:
-print("will also re-shape to",orig_shape)
-def rewriter(t):
-    print("re-saving time point:",t)
-    write_upscaled(f"man_track{t:04}.tif", masks_tracked[t], is_mask=True)
-#
-# serial
-# for t in range(masks_tracked.shape[0]): rewriter(t)
-#
-# parallel
-tasks = [ t for t in range(masks_tracked.shape[0]) ]
-P.process_with_multithreading(tasks, rewriter, NUM_PARALLEL_WORKERS, "ctc_writer")
 
-print("done exporting (2nd pass)")
+## <  memory-mapped version of load_ctc() >
+def load_ctc_into_store(from_folder, tp_range_from, tp_range_till, store_folder):
+    """
+    Like load_ctc_with_multiprocessing() but the frames are written into memory-mapped
+    files in the 'store_folder', and the returned arrays are backed by these files
+    (so the whole movie needs not fit into RAM). If the store has been already
+    completed in some previous run with the same parameters, it is just reopened.
+    """
+    global orig_shape
+
+    params = { 'from_folder': os.path.abspath(from_folder),
+               'tp_range': [tp_range_from, tp_range_till],
+               'downscale_xyz': [downscale_x, downscale_y, downscale_z],
+               'mask_downscale_reducer': mask_downscale_reducer,
+               'mask_downscale_keep_all_labels': mask_downscale_keep_all_labels }
+    imgs_store = TimeSeriesStore(store_folder, "imgs")
+    masks_store = TimeSeriesStore(store_folder, "masks")
+
+    if imgs_store.is_complete(params) and masks_store.is_complete(params):
+        print("reopening the already existing store in:",store_folder)
+        orig_shape = imgs_store.read_meta()['orig_shape']
+        return imgs_store.open(), masks_store.open()
 
+    # load the first image to understand the shape
+    fp = f"{from_folder}/t{tp_range_from:03}.tif"
+    print("reading the first raw file:",fp)
+    i = read_and_downscale(fp, is_mask=False)
+
+    tp_range = tp_range_till - tp_range_from +1
+    imgs = imgs_store.create([tp_range,*i.shape], i.dtype, params)
+    masks = masks_store.create([tp_range,*i.shape], 'uint16', params)
+    print("created memory-mapped files for twice the shapes:",imgs.shape)
+    imgs[0] = i
+
+    # the workers write directly into the memory-mapped files,
+    # the masks are loaded starting from the threads count found for the raw images
+    tuner = P.ConcurrencyTuner(P.get_workers_count(4.0))
+    tasks = [ (imgs,tp-tp_range_from,f"{from_folder}/t{tp:03}.tif",False) for tp in range(tp_range_from+1, tp_range_till+1) ]
+    for _ in P.process_adaptive(tasks, load_ctc_worker, thread_names="ctc_loader", ordered=False, tuner=tuner): pass
+
+    print("reading the masks now")
+    tasks = [ (masks,tp-tp_range_from,f"{from_folder}/SEG/mask{tp:03}.tif",True) for tp in range(tp_range_from, tp_range_till+1) ]
+    for _ in P.process_adaptive(tasks, load_ctc_worker, thread_names="ctc_loader", ordered=False, tuner=tuner): pass
+
+    imgs_store.mark_complete(imgs, orig_shape=orig_shape)
+    masks_store.mark_complete(masks, orig_shape=orig_shape)
+    print("done reading.")
+    return imgs_store.open(), masks_store.open()
+## </ memory-mapped version of load_ctc() >
+
+
+def relabel_original_mask(orig_mask_filepath, mask, mask_tracked, out_filepath):
+    """
+    Writes the original (full-resolution) mask relabeled with the track IDs, which are
+    learned from the pair of the downscaled 'mask' and its tracked version 'mask_tracked'.
+    Returns the consistency report from build_label_lut(), extended with 'untouched'
+    labels of the original mask that got no track ID (and thus were erased).
+    """
+    lut, report = build_label_lut(mask, mask_tracked)
+    orig_mask = read_tiff(orig_mask_filepath)
+    relabeled = apply_label_lut(orig_mask, lut)
+    with I.span('write'):
+        write_tiff(out_filepath, relabeled, preset=output_preset)
+
+    present = np.flatnonzero( np.bincount(orig_mask.ravel()) )
+    present = present[present > 0]
+    report['untouched'] = [ int(l) for l in present if l >= len(lut) or lut[l] == 0 ]
+    return report
+
+
+# NB: the processing is guarded because the workers of the multi-process loader
+#     may import this file again (and they must not start the tracking themselves)
+if __name__ == '__main__':
+    # NB: where the time goes (reading, downscaling, inference, writing, waiting of the workers)
+    #     is recorded when run as, e.g.:  PIPELINE_TRACE=tracking_trace.json python tracking.py
+    #     see util/instrumentation.py
+
+    # NB: the heavy imports are here, not at the top, to keep the loader's workers lean
+    import torch
+    from trackastra.model import Trackastra
+    from trackastra.tracking import graph_to_ctc, graph_to_napari_tracks
+    from trackastra.data import example_data_bacteria
+
+    # load some test data images and masks
+    # imgs, masks = example_data_bacteria()
+
+    ctc_folder = '/mnt/proj2/dd-24-22/Mastodon_paper/orig_as_CTC__own_SEG_TRA/'
+    tp_from, tp_till = 0, 600
+
+    #imgs, masks = load_ctc(ctc_folder, tp_from, tp_till)
+    #imgs, masks = load_ctc_with_multiprocessing(ctc_folder, tp_from, tp_till)
+    imgs, masks = load_ctc_with_shared_memory(ctc_folder, tp_from, tp_till)
+    #
+    # the memory-mapped variant, the second run (with the same downscaling) will not read the TIFFs again
+    #imgs, masks = load_ctc_into_store(ctc_folder, tp_from, tp_till, './downscaled_store')
+
+    # Load a pretrained model
+    #model = Trackastra.from_pretrained("general_2d", device=device)
+    #
+    # the 'ctc' model handles also 2d tracking
+    model = Trackastra.from_pretrained('ctc', device=device)
+
+    print("starting the tracking...")
+
+    # Track the cells
+    with I.span('inference'):
+        track_graph = model.track(imgs, masks, mode="greedy")  # or mode="ilp", or "greedy_nodiv"
+
+    print("done tracking.")
+
+    # Convert to cell tracking challenge format, but don't let it write the masks
+    # (it would write them with "ZSTD compression" and at the downscaled size),
+    # instead, only the tracks file is written here and the masks are written below
+    ctc_tracks, masks_tracked = graph_to_ctc(track_graph, masks, outdir=None)
+    with I.span('write'):
+        ctc_tracks.to_csv("man_track.txt", index=False, header=False, sep=" ")
+
+    print("done exporting (1st pass)")
+
+    print("will also re-shape to",orig_shape)
+    def rewriter(t):
+        print("re-saving time point:",t)
+        write_upscaled(f"man_track{t:04}.tif", masks_tracked[t], is_mask=True)
+
+    # ...but better, instead of up-scaling the tracked masks, relabel the original ones
+    def relabeler(t):
+        print("relabeling time point:",t)
+        return relabel_original_mask(f"{ctc_folder}/SEG/mask{t+tp_from:03}.tif", masks[t], masks_tracked[t], f"man_track{t:04}.tif")
+    #
+    # serial
+    # for t in range(masks_tracked.shape[0]): rewriter(t)
+    #
+    # parallel, streamed (not all tasks are submitted at once), with the threads count tuned while running
+    for t,report in P.process_adaptive(range(masks_tracked.shape[0]), relabeler, thread_names="ctc_writer", ordered=False):
+        if isinstance(report, tuple): print("failed relabeling time point:",t,report)
+        elif any(len(labels) > 0 for labels in report.values()): print("inconsistencies at time point:",t,report)
+
+    print("done exporting (2nd pass)")
+
+    for shared in shared_arrays: shared.unlink()
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Optional
+import numpy as np
+
+
+class ArrayCache:
+    """
+    A persistent on-disk cache of numpy arrays, e.g. of the results of some costly
+    reading-and-processing of image files, that survives between runs of a script.
+
+    Every array is stored in its own '.npy' file named after its key. The keys are
+    content-addressed, see 'key_for()', so a changed input file or changed processing
+    parameters never hit an outdated entry. The cache is kept under 'max_bytes'
+    by evicting the least recently used entries (file's mtime marks the last use).
+
+    The folder is scanned only when the running total of the cache size passes the
+    'max_bytes', and the eviction then goes down to the 'evict_to' fraction of it, so
+    that a full cache is not rescanned with every stored array. The entries stored
+    by other processes (sharing the folder) are counted only with the next scan.
+    """
+    def __init__(self, folder: str, max_bytes: int, evict_to: float = 0.9):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.evict_to = evict_to
+        self._total_bytes = None   # the running total, unknown till the first scan
+        os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def key_for(file_path: str, **params) -> str:
+        """
+        Returns a key that identifies the content of the 'file_path' (by its path,
+        size and modification time) processed with the given (JSON-able) 'params'.
+        """
+        st = os.stat(file_path)
+        desc = json.dumps([os.path.abspath(file_path), st.st_size, st.st_mtime_ns, params], sort_keys=True)
+        return hashlib.sha1(desc.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Returns the cached array, or None if there's none for the 'key'.
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)  # mark as the most recently used
+            return np.load(path)
+        except (FileNotFoundError, ValueError, EOFError):
+            # ValueError/EOFError: someone is just evicting (or just wrote a broken) file
+            return None
+
+    def put(self, key: str, array: np.ndarray):
+        """
+        Stores the 'array' under the 'key', and evicts old entries if the cache got too big.
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+            size = f.tell()
+        os.replace(tmp_path, path)
+
+        # NB: an overwritten entry is counted twice, which only brings the next scan closer
+        if self._total_bytes is not None: self._total_bytes += size
+        if self._total_bytes is None or self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Scans the cache, and if it doesn't fit into 'max_bytes', removes the least
+        recently used entries until it fits into the 'evict_to' fraction of it.
+        """
+        entries = []
+        for entry in os.scandir(self.folder):
+            if not entry.name.endswith(".npy"): continue
+            try:
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+            except FileNotFoundError:
+                pass
+
+        total_bytes = sum(size for _,size,_ in entries)
+        target_bytes = self.max_bytes if total_bytes <= self.max_bytes else self.evict_to * self.max_bytes
+        entries.sort()
+        for _,size,path in entries:
+            if total_bytes <= target_bytes: break
+            try:
+                os.remove(path)
+                logging.info(f"evicted from cache: {path}")
+            except FileNotFoundError:
+                pass  # already evicted by someone else
+            total_bytes -= size
+        self._total_bytes = total_bytes
@@ -0,0 +1,77 @@
+import os
+import json
+import hashlib
+from typing import Any, Dict, List
+import tifffile as TIFF
+
+
+def file_fingerprint(file_path: str, hash_content: bool = False) -> str:
+    """
+    Returns a string that changes whenever the file changes: by default it's
+    made from the file's size and modification time, which is cheap; with
+    'hash_content' set, it's the SHA1 of the whole file content.
+    """
+    if not hash_content:
+        st = os.stat(file_path)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    sha = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(1 << 24):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def atomic_write_tiff(file_path: str, img, **imwrite_kwargs):
+    """
+    Writes the 'img' with 'tifffile.imwrite()' first into a temporary file next to
+    the 'file_path', and renames it to the 'file_path' only after it is complete.
+    An interrupted write thus never leaves a partially written file under the final name.
+    """
+    folder, name = os.path.split(file_path)
+    tmp_path = os.path.join(folder, f".{name}.{os.getpid()}.tmp")
+    try:
+        TIFF.imwrite(tmp_path, img, **imwrite_kwargs)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+
+
+class CheckpointManifest:
+    """
+    Remembers which outputs have been completed, from which inputs and with which
+    parameters, so that a restarted processing can skip them. Every output has
+    its own small record file in the manifest 'folder', and so independent workers
+    (e.g. tasks of a SLURM job array) can share the manifest without any locking.
+    """
+    def __init__(self, folder: str, hash_content: bool = False):
+        self.folder = folder
+        self.hash_content = hash_content
+        os.makedirs(folder, exist_ok=True)
+
+    def _record_path(self, output_path: str) -> str:
+        return os.path.join(self.folder, f"{os.path.basename(output_path)}.json")
+
+    def _record(self, output_path: str, input_paths: List[str], params: Dict[str, Any]) -> Dict[str, Any]:
+        return { 'output': os.path.abspath(output_path),
+                 'output_size': os.path.getsize(output_path),
+                 'inputs': { os.path.abspath(p): file_fingerprint(p, self.hash_content) for p in input_paths },
+                 'params': json.loads(json.dumps(params)) }
+
+    def is_done(self, output_path: str, input_paths: List[str], params: Dict[str, Any]) -> bool:
+        """
+        Returns True if the 'output_path' exists and has been recorded as done
+        from the same (unchanged) 'input_paths' and with the same 'params'.
+        """
+        record_path = self._record_path(output_path)
+        if not os.path.exists(record_path) or not os.path.exists(output_path): return False
+        with open(record_path, 'r') as f:
+            recorded = json.load(f)
+        return recorded == self._record(output_path, input_paths, params)
+
+    def mark_done(self, output_path: str, input_paths: List[str], params: Dict[str, Any]):
+        record_path = self._record_path(output_path)
+        tmp_path = f"{record_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._record(output_path, input_paths, params), f, indent=2)
+        os.replace(tmp_path, record_path)
@@ -0,0 +1,242 @@
+import os
+import sys
+import csv
+import json
+import time
+import atexit
+import threading
+import functools
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+
+# Lightweight recording of where the time goes:
+#
+# - 'span()' (a context manager) and 'spanned()' (a decorator) record how long a named
+#   piece of code took, e.g. "read", "downscale", "inference", "write", in which process
+#   and thread, into one common list of events
+#
+# - the pools of 'util/parallelism_paradigms.py' record for every task its "queue-wait"
+#   (from the submission till a worker has picked it up) and the task itself, also when
+#   the task runs in another process (its events are then sent back with its result)
+#
+# - 'summary()' reports the busy fraction of every worker and the peak RSS, and 'dump()'
+#   writes the events as a Chrome trace (.json, open in chrome://tracing or ui.perfetto.dev)
+#   or as a table (.csv); a mostly idle set of workers with long "read" spans points at
+#   an I/O bottleneck, busy workers with long compute spans at a CPU bottleneck
+#
+# The recording is off (and costs nothing) until 'enable()' is called, or until the
+# environment variable PIPELINE_TRACE is set to the path of the trace file to be written
+# at the end of the run, e.g.:  PIPELINE_TRACE=trace.json python tracking.py
+
+
+_enabled = False
+_owner_pid = None           # the process that has enabled the recording and collects all events
+_events: List[Dict] = []    # the recorded spans, times in nanoseconds of time.perf_counter_ns()
+_lock = threading.Lock()
+
+
+def enable(trace_path: Optional[str] = None):
+    """
+    Starts the recording; if 'trace_path' is given, the events and the summary are
+    written there (see 'dump()') when this process ends.
+    """
+    global _enabled, _owner_pid
+    _enabled = True
+    _owner_pid = os.getpid()
+    if trace_path is not None:
+        atexit.register(dump, trace_path)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def now() -> int:
+    # a monotonic clock shared by all processes of the machine, so the events of the
+    # worker processes fit on the same time axis
+    return time.perf_counter_ns()
+
+
+def record(name: str, category: str, start_ns: int, end_ns: int, **args):
+    if not _enabled: return
+    thread = threading.current_thread()
+    event = { 'name': name, 'cat': category, 'start_ns': start_ns, 'end_ns': end_ns,
+              'pid': os.getpid(), 'tid': thread.ident, 'thread': thread.name, 'args': args }
+    with _lock: _events.append(event)
+
+
+@contextmanager
+def span(name: str, category: str = 'work', **args):
+    """
+    Records the time spent in the 'with span(...)' block under the 'name'.
+    """
+    if not _enabled:
+        yield
+        return
+    start_ns = now()
+    try:
+        yield
+    finally:
+        record(name, category, start_ns, now(), **args)
+
+
+def spanned(name: Optional[str] = None, category: str = 'work'):
+    """
+    Decorator that records every call of the function as a span (named after
+    the function, unless 'name' is given).
+    """
+    def decorate(fun):
+        @functools.wraps(fun)
+        def wrapper(*args, **kwargs):
+            with span(name or fun.__name__, category):
+                return fun(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class _TracedOutput:
+    # the output of a task from a worker process, together with its events
+    def __init__(self, output: Any, events: List[Dict]):
+        self.output = output
+        self.events = events
+
+
+def traced_call(task_name: str, process_fun, submitted_ns: int, *args) -> Any:
+    """
+    Calls 'process_fun(*args)' as a task of a pool, and records its queue-wait and the task
+    (under the 'task_name'). Used by the pools, 'submitted_ns' is the 'now()' of when the task
+    was submitted.
+    """
+    global _enabled
+    in_worker_process = os.getpid() != _owner_pid
+    if in_worker_process:
+        # the events of a worker process belong to the parent process,
+        # they are carried back and not kept here
+        _enabled = True
+        with _lock: first_event = len(_events)
+
+    start_ns = now()
+    record('queue-wait', 'wait', submitted_ns, start_ns)
+    try:
+        with span(task_name, 'task'):
+            output = process_fun(*args)
+    finally:
+        if in_worker_process:
+            with _lock:
+                events = _events[first_event:]
+                del _events[first_event:]
+
+    if not in_worker_process: return output
+
+    events.append({ 'name': 'peak RSS [MB]', 'cat': 'memory', 'start_ns': now(), 'end_ns': None,
+                    'pid': os.getpid(), 'tid': threading.get_ident(), 'thread': threading.current_thread().name,
+                    'args': { 'rss': peak_rss_mb() } })
+    return _TracedOutput(output, events)
+
+
+def untraced_output(output: Any) -> Any:
+    """
+    Returns the task's own output, and keeps the events that came along with it from a worker process.
+    """
+    if not isinstance(output, _TracedOutput): return output
+    with _lock: _events.extend(output.events)
+    return output.output
+
+
+def peak_rss_mb(children: bool = False) -> Optional[float]:
+    """
+    Returns the peak resident memory of this process (or of its ended child processes) in MB,
+    or None where it can't be determined (e.g. on Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # Linux reports kilobytes, macOS bytes
+    return usage.ru_maxrss / (1 << 20 if sys.platform == 'darwin' else 1 << 10)
+
+
+def summary() -> Dict:
+    """
+    Returns the per-worker utilisation of every pool (the fraction of the pool's lifetime,
+    in which the worker was running a task), the total times per span name, and the peak
+    RSS of this process and of its (ended) child processes.
+    """
+    with _lock: events = [ e for e in _events if e['end_ns'] is not None ]
+
+    pools = sorted([ e for e in events if e['cat'] == 'pool' ], key=lambda e: e['start_ns'])
+    tasks = [ e for e in events if e['cat'] == 'task' ]
+    utilisation = dict()
+    for p,pool in enumerate(pools):
+        duration_ns = pool['end_ns'] - pool['start_ns']
+        busy = dict()
+        for e in tasks:
+            if e['start_ns'] < pool['start_ns'] or e['end_ns'] > pool['end_ns']: continue
+            key = (e['pid'], e['thread'])
+            busy[key] = busy.get(key, 0) + e['end_ns'] - e['start_ns']
+        for key,busy_ns in busy.items():
+            name = f"pool #{p} '{pool['name']}': {key[1]} (pid {key[0]})"
+            utilisation[name] = busy_ns / duration_ns if duration_ns > 0 else 1.0
+
+    totals = dict()
+    for e in events:
+        if e['cat'] == 'pool': continue
+        totals[e['name']] = totals.get(e['name'], 0.0) + (e['end_ns'] - e['start_ns']) / 1e9
+
+    worker_rss = [ rss for rss in [peak_rss_mb(children=True)] + [ e['args']['rss'] for e in _events if e['cat'] == 'memory' ]
+                   if rss is not None ]
+    return { 'worker_utilisation': utilisation, 'total_seconds': totals,
+             'peak_rss_mb': peak_rss_mb(),
+             'peak_rss_mb_children': max(worker_rss, default=None) }
+
+
+def dump(trace_path: str):
+    """
+    Writes all recorded events into the 'trace_path', as a Chrome trace if it ends
+    with '.json', otherwise as a CSV table, and logs the 'summary()'.
+    """
+    with _lock: events = list(_events)
+    t0 = min((e['start_ns'] for e in events), default=0)
+
+    if trace_path.endswith('.json'):
+        trace = []
+        # NB: the ids of ended threads get reused, the thread is named after its last appearance
+        thread_names = { (e['pid'], e['tid']):e['thread'] for e in events }
+        for (pid,tid),name in thread_names.items():
+            trace.append({ 'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid, 'args': { 'name': name } })
+        for e in events:
+            ts = (e['start_ns'] - t0) / 1000
+            if e['end_ns'] is None:
+                trace.append({ 'ph': 'C', 'name': e['name'], 'cat': e['cat'], 'ts': ts, 'pid': e['pid'], 'args': e['args'] })
+            else:
+                trace.append({ 'ph': 'X', 'name': e['name'], 'cat': e['cat'], 'ts': ts, 'dur': (e['end_ns'] - e['start_ns']) / 1000,
+                               'pid': e['pid'], 'tid': e['tid'], 'args': e['args'] })
+        with open(trace_path, 'w') as f:
+            json.dump({ 'traceEvents': trace, 'otherData': summary() }, f)
+    else:
+        with open(trace_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['name', 'category', 'pid', 'thread', 'start_s', 'duration_s', 'args'])
+            for e in events:
+                duration = (e['end_ns'] - e['start_ns']) / 1e9 if e['end_ns'] is not None else ''
+                writer.writerow([ e['name'], e['cat'], e['pid'], e['thread'],
+                                  (e['start_ns'] - t0) / 1e9, duration, json.dumps(e['args']) if e['args'] else '' ])
+
+    report = summary()
+    logging.info(f"trace of {len(events)} events written to: {trace_path}")
+    for name,seconds in sorted(report['total_seconds'].items(), key=lambda x: -x[1]):
+        logging.info(f"  total {seconds:10.3f} s in '{name}'")
+    for name,fraction in sorted(report['worker_utilisation'].items()):
+        logging.info(f"  worker {name} busy {100*fraction:.1f} %")
+    if report['peak_rss_mb'] is not None:
+        children_rss = report['peak_rss_mb_children'] or 0.0
+        logging.info(f"  peak RSS {report['peak_rss_mb']:.1f} MB, of the worker processes {children_rss:.1f} MB")
+
+
+# NB: the (spawned) worker processes inherit the environment, but must not write the trace themselves
+if os.environ.get('PIPELINE_TRACE') and os.environ.get('PIPELINE_TRACE_OWNER', str(os.getpid())) == str(os.getpid()):
+    os.environ['PIPELINE_TRACE_OWNER'] = str(os.getpid())
+    enable(os.environ['PIPELINE_TRACE'])
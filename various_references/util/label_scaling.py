@@ -0,0 +1,95 @@
+import numpy as np
+from typing import Sequence
+
+
+# Nearest-neighbour rescaling of label images (masks) that never leaves the native dtype
+# of the image, as opposed to skimage.transform.resize() that converts to float64 first.
+#
+# The factors are integers (given per axis, in the axis order of the image), and
+# the downscaled size of an axis is 'size // factor' -- like in the 'tracking.py'.
+
+
+def _nearest_indices(size_in: int, size_out: int) -> np.ndarray:
+    # the centre of the output pixel 'j' maps onto the input pixel floor((j+0.5) * size_in/size_out)
+    return ((2*np.arange(size_out) + 1) * size_in) // (2*size_out)
+
+
+def _mode_of_blocks(img: np.ndarray, factors: Sequence[int], out_shape: Sequence[int]) -> np.ndarray:
+    # crop to full blocks, and consider one output "row" (along the first axis) after another
+    # to keep the intermediate (blocks_count x block_size x block_size) arrays small
+    block_size = int(np.prod(factors))
+    out = np.empty(out_shape, dtype=img.dtype)
+    f0 = factors[0]
+    for i in range(out_shape[0]):
+        slab = img[(slice(i*f0, (i+1)*f0), *[ slice(0, o*f) for o,f in zip(out_shape[1:], factors[1:]) ])]
+        # (f0, o1,f1, o2,f2, ...) -> (o1,o2,..., f0,f1,f2,...) -> (blocks, block_size)
+        shape = [f0]
+        for o,f in zip(out_shape[1:], factors[1:]): shape += [o, f]
+        slab = slab.reshape(shape)
+        axes = list(range(1, len(shape), 2)) + [0] + list(range(2, len(shape), 2))
+        blocks = slab.transpose(axes).reshape(-1, block_size)
+
+        # how many times each value appears within its block, the first most frequent wins
+        counts = (blocks[:, :, None] == blocks[:, None, :]).sum(axis=2)
+        winners = np.argmax(counts, axis=1)
+        out[i] = blocks[np.arange(len(blocks)), winners].reshape(out_shape[1:])
+    return out
+
+
+def _restore_lost_labels(img: np.ndarray, out: np.ndarray, factors: Sequence[int]) -> list:
+    # presence of labels via bincount, which is a single pass over the image
+    img_flat = img.ravel() if np.can_cast(img.dtype, np.intp, 'safe') else img.ravel().astype(np.intp)
+    out_flat = out.ravel() if np.can_cast(out.dtype, np.intp, 'safe') else out.ravel().astype(np.intp)
+    present_in = np.bincount(img_flat) > 0
+    present_out = np.bincount(out_flat, minlength=len(present_in))[:len(present_in)] > 0
+    present_in[0] = False  # background is never "lost"
+    lost = np.flatnonzero(present_in & ~present_out)
+    if len(lost) == 0: return []
+
+    # place every lost label as a single pixel where it first appeared in the input
+    coords = np.nonzero(np.isin(img, lost))
+    labels, first = np.unique(img[coords], return_index=True)
+    out_coords = tuple( np.minimum(c[first] // f, s-1) for c,f,s in zip(coords, factors, out.shape) )
+    out[out_coords] = labels
+    return labels.tolist()
+
+
+def downscale_labels(img: np.ndarray, factors: Sequence[int],
+                     reducer: str = 'nearest', keep_all_labels: bool = False) -> np.ndarray:
+    """
+    Returns the label image 'img' downscaled by the integer 'factors' (one per axis).
+
+    With the 'nearest' reducer, every output pixel takes the label of the input pixel
+    at the centre of its block (like a nearest-neighbour resize does); with the 'mode'
+    reducer, it takes the most frequent label in its block (slower, but it follows
+    the shapes more faithfully).
+
+    With 'keep_all_labels', labels that would otherwise disappear (small objects)
+    are placed as a single pixel into the output, so that no label is lost.
+    """
+    factors = [ int(f) for f in factors ]
+    if len(factors) != img.ndim:
+        raise ValueError(f"Expected {img.ndim} factors for an image of shape {img.shape}, got {factors}")
+    out_shape = [ max(1, s // f) for s,f in zip(img.shape, factors) ]
+
+    if reducer == 'nearest':
+        out = img[np.ix_(*[ _nearest_indices(s,o) for s,o in zip(img.shape, out_shape) ])]
+    elif reducer == 'mode':
+        if any(s < f for s,f in zip(img.shape, factors)):
+            raise ValueError(f"Image of shape {img.shape} is smaller than one block of {factors}")
+        out = _mode_of_blocks(img, factors, out_shape)
+    else:
+        raise ValueError(f"Unknown reducer '{reducer}', use 'nearest' or 'mode'")
+
+    if keep_all_labels: _restore_lost_labels(img, out, factors)
+    return out
+
+
+def upscale_labels(img: np.ndarray, out_shape: Sequence[int]) -> np.ndarray:
+    """
+    Returns the label image 'img' nearest-neighbour upscaled to the 'out_shape',
+    which needs not be an exact multiple of the 'img.shape'.
+    """
+    if len(out_shape) != img.ndim:
+        raise ValueError(f"Cannot upscale an image of shape {img.shape} to {out_shape}")
+    return img[np.ix_(*[ _nearest_indices(s,o) for s,o in zip(img.shape, out_shape) ])]
@@ -1,8 +1,14 @@
 import os
+import sys
+import math
+import time
 import concurrent.futures
 import threading
-from typing import List, Any, Optional
+from multiprocessing import shared_memory
+from typing import List, Any, Optional, Iterable, Iterator, Tuple
 import logging
+import numpy as np
+import util.instrumentation as I
 
 
 # Configure logging to see which thread processes which file
@@ -12,9 +18,39 @@ logging.basicConfig(
 )
 
 
+def available_cpus() -> Optional[int]:
+    """
+    Get the number of CPU cores this process is allowed to use, which is on shared
+    (cluster) nodes typically fewer than all cores of the machine ('os.cpu_count()'):
+    the smallest of the SLURM allocation (env. variable SLURM_CPUS_PER_TASK), the CPU
+    affinity mask ('os.sched_getaffinity()') and the cgroup (v2) CPU quota.
+    Returns None if none of these can be determined.
+    """
+    counts = []
+
+    slurm_cpus = os.environ.get('SLURM_CPUS_PER_TASK')
+    if slurm_cpus is not None and slurm_cpus.isdigit() and int(slurm_cpus) > 0:
+        counts.append(int(slurm_cpus))
+
+    if hasattr(os, 'sched_getaffinity'):
+        counts.append(len(os.sched_getaffinity(0)))
+    elif os.cpu_count() is not None:
+        counts.append(os.cpu_count())
+
+    try:
+        with open('/sys/fs/cgroup/cpu.max', 'r') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            counts.append(max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return min(counts) if len(counts) > 0 else None
+
+
 def get_workers_count(multiplier = 1.0):
     """
-    Get the number of CPU cores available.
+    Get the number of CPU cores available (to this process, see 'available_cpus()').
     If CPU count fails to be determined, fallback value is 4.
 
     Note for threading vs multiprocessing:
@@ -25,8 +61,9 @@ def get_workers_count(multiplier = 1.0):
     Since file processing is likely I/O-bound, using 1.5-2x the CPU count for threads
     is often optimal. But(!) make sure the bottle neck really is I/O ops and not some
     image processing on the just opened files (in which case it becomes CPU-bound).
+    When unsure, let the 'process_adaptive()' find the right count while it runs.
     """
-    cpu_count = os.cpu_count()
+    cpu_count = available_cpus()
     if cpu_count is None:
         return 4  # Fallback default
     return max(1, int(multiplier * cpu_count))
@@ -48,6 +85,21 @@ def example_process_item(input: Any) -> Any:
     return "resolved"
 
 
+def _submit(executor, process_fun, *args, task_name: Optional[str] = None) -> concurrent.futures.Future:
+    # with the instrumentation on, the task and its waiting in the queue are recorded
+    if not I.is_enabled(): return executor.submit(process_fun, *args)
+    task_name = task_name or getattr(process_fun, '__name__', 'task')
+    return executor.submit(I.traced_call, task_name, process_fun, I.now(), *args)
+
+
+def _fetch_result(future, index: int) -> Any:
+    try:
+        return I.untraced_output( future.result() )
+    except Exception as e:
+        logging.error(f"Exception occurred while fetching result for index {index}: {e}")
+        return ('FAIL', str(e))
+
+
 def process_with_multithreading(inputs: List[Any],
                                 process_fun,
                                 num_threads: int,
@@ -65,20 +117,17 @@ def process_with_multithreading(inputs: List[Any],
     outputs = [ None for _ in range(len(inputs)) ]
 
     with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads,
-                                               thread_name_prefix=thread_names) as executor:
+                                               thread_name_prefix=thread_names) as executor, \
+         I.span(thread_names, 'pool'):
 
         # Submit all tasks to the executor, noting done to where outputs shall belong
-        future_to_index = { executor.submit(process_fun, inputs[index]): index  for index in range(len(inputs)) }
+        future_to_index = { _submit(executor, process_fun, inputs[index]): index  for index in range(len(inputs)) }
 
         # Collect results as they complete
         try:
             for future in concurrent.futures.as_completed(future_to_index, timeout=timeout):
                 index = future_to_index[future]
-                try:
-                    outputs[index] = future.result()
-                except Exception as e:
-                    logging.error(f"Exception occurred while fetching result for index {index}: {e}")
-                    outputs[index] = ('FAIL', str(e))
+                outputs[index] = _fetch_result(future, index)
 
         except concurrent.futures.TimeoutError:
             logging.error(f"Operation timed out after {timeout} seconds")
@@ -88,35 +137,96 @@ def process_with_multithreading(inputs: List[Any],
     return outputs
 
 
+class SharedNDArray:
+    """
+    A numpy array that lives in a 'multiprocessing.shared_memory' block, and
+    which can be thus filled from other processes without any copying and pickling.
+
+    The parent creates it with 'SharedNDArray(shape, dtype)', and hands over
+    its (picklable) 'descriptor' to the workers, which in turn attach to it
+    with 'SharedNDArray.attach(descriptor)'. The parent should 'unlink()' it
+    once it is no longer needed, otherwise the memory stays allocated in the OS.
+    """
+    def __init__(self, shape, dtype, _name: Optional[str] = None):
+        dtype = np.dtype(dtype)
+        if _name is None:
+            nbytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        elif sys.version_info >= (3, 13):
+            # attaching only, the creator is the one responsible for the clean up
+            self.shm = shared_memory.SharedMemory(name=_name, track=False)
+        else:
+            self.shm = shared_memory.SharedMemory(name=_name)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    @property
+    def descriptor(self) -> Tuple[str, Tuple[int, ...], str]:
+        return (self.shm.name, tuple(self.array.shape), self.array.dtype.str)
+
+    @classmethod
+    def attach(cls, descriptor: Tuple[str, Tuple[int, ...], str]) -> 'SharedNDArray':
+        name, shape, dtype = descriptor
+        return cls(shape, dtype, _name=name)
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+
+    def unlink(self):
+        # the memory is given back to the OS once all processes have closed it (or ended)
+        self.shm.unlink()
+
+
+# attached shared arrays, kept per (worker) process to attach only once
+_attached_shared_arrays = dict()
+
+def _process_into_shared_array(process_fun, shared_descriptor, index: int, input: Any) -> str:
+    shared = _attached_shared_arrays.get(shared_descriptor[0])
+    if shared is None:
+        shared = SharedNDArray.attach(shared_descriptor)
+        _attached_shared_arrays[shared_descriptor[0]] = shared
+    shared.array[index] = process_fun(input)
+    return "OK"
+
+
 def process_with_multiprocessing(inputs: List[Any],
                                  process_fun,
                                  num_processes: int,
-                                 timeout: Optional[float] = None) -> List[Any]:
+                                 timeout: Optional[float] = None,
+                                 into_shared_array: Optional[SharedNDArray] = None) -> List[Any]:
     """
     Process 'inputs' items, each item consumed with 'process_fun()', using a
     pool of 'num_processes' independent processes, but wait no longer than 'timeout' seconds.
     Default waiting time is 'None' -- meaning infinity, no set timeout.
     The 'process_fun' must be a named function, cannot be a lambda (see doc of ProcessPoolExecutor).
 
+    If 'into_shared_array' is given, the 'inputs' items must be pairs '(index, item)',
+    and the worker stores the (numpy) result of 'process_fun(item)' directly into
+    'into_shared_array.array[index]'. Only the "OK" flag is then passed back to this
+    process, avoiding the pickling and copying of the (potentially large) results.
+
     Returns:
         List of 'outputs' (an output can be just a flag) from processing each 'input' item.
     """
     outputs = [ None for _ in range(len(inputs)) ]
 
-    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor:
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor, \
+         I.span('processes', 'pool'):
 
         # Submit all tasks to the executor, noting done to where outputs shall belong
-        future_to_index = { executor.submit(process_fun, inputs[index]): index  for index in range(len(inputs)) }
+        if into_shared_array is None:
+            future_to_index = { _submit(executor, process_fun, inputs[index]): index  for index in range(len(inputs)) }
+        else:
+            descriptor = into_shared_array.descriptor
+            future_to_index = { _submit(executor, _process_into_shared_array, process_fun, descriptor, *inputs[index],
+                                        task_name=getattr(process_fun, '__name__', None)): index
+                                for index in range(len(inputs)) }
 
         # Collect results as they complete
         try:
             for future in concurrent.futures.as_completed(future_to_index, timeout=timeout):
                 index = future_to_index[future]
-                try:
-                    outputs[index] = future.result()
-                except Exception as e:
-                    logging.error(f"Exception occurred while fetching result for index {index}: {e}")
-                    outputs[index] = ('FAIL', str(e))
+                outputs[index] = _fetch_result(future, index)
 
         except concurrent.futures.TimeoutError:
             logging.error(f"Operation timed out after {timeout} seconds")
@@ -127,6 +237,225 @@ def process_with_multiprocessing(inputs: List[Any],
 
 
 
+def process_streaming(inputs: Iterable[Any],
+                      process_fun,
+                      num_workers: int,
+                      max_in_flight: Optional[int] = None,
+                      ordered: bool = True,
+                      use_processes: bool = False,
+                      thread_names: str = 'pyProcessors',
+                      timeout: Optional[float] = None,
+                      tuner: Optional['ConcurrencyTuner'] = None) -> Iterator[Tuple[int, Any]]:
+    """
+    Process 'inputs' items, each item consumed with 'process_fun()', using a pool
+    of 'num_workers' threads (or processes if 'use_processes' is set), and yield
+    the '(index, output)' pairs as a generator, where 'index' is the position of
+    the item in the 'inputs'.
+
+    Unlike the two functions above, 'inputs' can be any iterable (e.g. a generator
+    that is opening the files lazily) and the items are pulled from it only when
+    there is a room for them: not more than 'max_in_flight' items (default is twice
+    the 'num_workers') are submitted or kept waiting for being yielded at any moment.
+    Only this window of items (and their outputs) is thus held in the memory,
+    irrespective of how many items there are in total.
+
+    With 'ordered' set, the outputs are yielded in the order of the 'inputs',
+    otherwise they are yielded as soon as they are available. In the ordered mode,
+    one slow item may stall the pulling of new items when the window gets full.
+
+    The 'timeout' is the longest time in seconds to wait for any next output
+    (not for all of them), default 'None' means infinity, no set timeout.
+    When it passes, the outputs that have finished already are still yielded (in the
+    ordered mode then also those after a missing one), and 'concurrent.futures.TimeoutError'
+    is raised -- the consumer can tell that the outputs of the unfinished items are missing.
+    Process workers can't be labeled, and the 'process_fun' must be a named
+    function in that case (see doc of ProcessPoolExecutor).
+
+    With a 'tuner' (see 'ConcurrencyTuner'), not more than 'tuner.limit' items are
+    processed at the same time, and the tuner is notified about every finished item.
+
+    Returns:
+        Generator of '(index, output)' pairs (an output can be just a flag).
+    """
+    if max_in_flight is None: max_in_flight = 2*num_workers
+    max_in_flight = max(1, max_in_flight)
+
+    if use_processes:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_workers)
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_workers,
+                                                         thread_name_prefix=thread_names)
+
+    pool_span = I.span('processes' if use_processes else thread_names, 'pool')
+    pool_span.__enter__()
+
+    inputs_iter = iter(inputs)
+    future_to_index = dict()   # submitted, not yet finished
+    ready_outputs = dict()     # finished, not yet yielded (only in the ordered mode)
+    next_index_to_submit = 0
+    next_index_to_yield = 0
+
+    try:
+        while True:
+            # top up the window
+            while len(future_to_index) + len(ready_outputs) < max_in_flight \
+                    and (tuner is None or len(future_to_index) < tuner.limit):
+                try:
+                    item = next(inputs_iter)
+                except StopIteration:
+                    break
+                future_to_index[ _submit(executor, process_fun, item) ] = next_index_to_submit
+                next_index_to_submit += 1
+
+            if len(future_to_index) == 0: break
+
+            done,_ = concurrent.futures.wait(future_to_index, timeout=timeout,
+                                             return_when=concurrent.futures.FIRST_COMPLETED)
+            if len(done) == 0:
+                logging.error(f"Operation timed out after {timeout} seconds")
+                for index in sorted(ready_outputs):
+                    yield index, ready_outputs.pop(index)
+                raise concurrent.futures.TimeoutError(f"No output within {timeout} seconds, "
+                                                      f"{len(future_to_index)} item(s) unfinished")
+
+            for future in done:
+                index = future_to_index.pop(future)
+                if tuner is not None: tuner.task_done()
+                if ordered:
+                    ready_outputs[index] = _fetch_result(future, index)
+                else:
+                    yield index, _fetch_result(future, index)
+
+            while next_index_to_yield in ready_outputs:
+                yield next_index_to_yield, ready_outputs.pop(next_index_to_yield)
+                next_index_to_yield += 1
+
+    finally:
+        # reached also when the consumer of this generator stops early,
+        # cancel what hasn't started yet and don't wait for the rest
+        for future in future_to_index: future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+        pool_span.__exit__(None, None, None)
+
+
+
+class ConcurrencyTuner:
+    """
+    Finds the number of concurrently processed items (the "workers count") with the
+    highest throughput, while the items are being processed: the throughput (items per
+    second) is measured over windows of at least 'min_window_seconds' (and 'min_window_items'
+    finished items), and after every window another count is tried, a step away from the
+    best one so far. The first window after a change is not measured, as its items were
+    largely started under the previous count. A count becomes the best one
+    if it has improved the throughput by more than the 'tolerance' fraction, or if it is
+    a lower count that hasn't worsened it by more than the 'tolerance'. Then the step is
+    doubled, otherwise the direction is reversed and the step is halved -- the count thus
+    settles around the "knee" of the throughput curve (beyond which more workers bring
+    nothing, e.g. the disk is saturated), and keeps probing its close neighbourhood.
+
+    The count stays within ['min_limit', 'max_limit'], starting at 'initial_limit'
+    (default: the number of available CPUs). One tuner can be used for several
+    (similar) batches, so the later ones start from what the earlier ones found.
+    """
+    def __init__(self, max_limit: int, min_limit: int = 1, initial_limit: Optional[int] = None,
+                 tolerance: float = 0.05, min_window_seconds: float = 0.5, min_window_items: int = 4):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        if initial_limit is None: initial_limit = get_workers_count()
+        self.limit = min(self.max_limit, max(self.min_limit, initial_limit))
+        self.tolerance = tolerance
+        self.min_window_seconds = min_window_seconds
+        self.min_window_items = max(1, min_window_items)
+
+        self.direction = +1
+        self.step = max(1, self.limit // 2)
+        self.best_limit = self.limit
+        self.best_throughput = None
+        self.history: List[Tuple[int, float]] = []   # (limit, measured throughput) of every window
+        self._window_start = None
+        self._window_done = 0
+        self._settling = False   # the current window follows a change of the count
+
+    def restart_window(self):
+        # e.g. at the start of the next batch, not to measure the pause in between
+        self._window_start = None
+        self._window_done = 0
+        self._settling = False
+
+    def task_done(self):
+        now = time.perf_counter()
+        if self._window_start is None:
+            # the very first window starts with the first finished item
+            self._window_start = now
+            return
+        self._window_done += 1
+
+        elapsed = now - self._window_start
+        if self._window_done < self.min_window_items or elapsed < self.min_window_seconds: return
+
+        if self._settling:
+            self._settling = False
+        else:
+            throughput = self._window_done / elapsed
+            self.history.append((self.limit, throughput))
+            self._adjust(throughput)
+        self._window_start = now
+        self._window_done = 0
+
+    def _adjust(self, throughput: float):
+        if self.best_throughput is None or self.limit == self.best_limit:
+            # the first, or a fresh measurement of the best count so far
+            self.best_limit, self.best_throughput = self.limit, throughput
+        elif throughput > self.best_throughput * (1.0 + self.tolerance) or \
+             (self.limit < self.best_limit and throughput >= self.best_throughput * (1.0 - self.tolerance)):
+            # more throughput, or the same throughput with fewer workers: hurry on in this direction
+            self.best_limit, self.best_throughput = self.limit, throughput
+            self.step = min(self.step * 2, self.max_limit)
+        else:
+            # not worth it: back to the best count, and try the other way with a finer step
+            self.direction = -self.direction
+            self.step = max(1, self.step // 2)
+
+        new_limit = min(self.max_limit, max(self.min_limit, self.best_limit + self.direction*self.step))
+        if new_limit == self.best_limit:
+            # at a bound, the next try goes the other way
+            self.direction = -self.direction
+            new_limit = min(self.max_limit, max(self.min_limit, self.best_limit + self.direction*self.step))
+        logging.info(f"throughput {throughput:.2f} items/s with {self.limit} workers, trying {new_limit} workers next")
+        self._settling = new_limit != self.limit
+        self.limit = new_limit
+
+
+def process_adaptive(inputs: Iterable[Any],
+                     process_fun,
+                     max_workers: Optional[int] = None,
+                     ordered: bool = True,
+                     use_processes: bool = False,
+                     thread_names: str = 'pyProcessors',
+                     timeout: Optional[float] = None,
+                     tuner: Optional[ConcurrencyTuner] = None) -> Iterator[Tuple[int, Any]]:
+    """
+    Like 'process_streaming()', but the number of workers is not given -- it is tuned
+    while the 'inputs' are processed, see 'ConcurrencyTuner'. A pool of 'max_workers'
+    threads (or processes if 'use_processes' is set) is created, and the tuner
+    decides how many of them are given an item at the same time.
+
+    The 'max_workers' defaults to four times (threads, for the I/O-bound work), or once
+    (processes, for the CPU-bound work) the number of available CPUs. A 'tuner' can
+    be passed in to continue from an earlier tuning (its 'max_limit' is then used).
+
+    Returns:
+        Generator of '(index, output)' pairs (an output can be just a flag).
+    """
+    if tuner is None:
+        if max_workers is None: max_workers = get_workers_count(1.0 if use_processes else 4.0)
+        tuner = ConcurrencyTuner(max_workers)
+    tuner.restart_window()
+    return process_streaming(inputs, process_fun, tuner.max_limit, max_in_flight=2*tuner.max_limit,
+                             ordered=ordered, use_processes=use_processes, thread_names=thread_names,
+                             timeout=timeout, tuner=tuner)
+
+
 def example():
     files_to_process = [
         "file1.txt",
@@ -151,6 +480,15 @@ def example():
     outputs = process_with_multiprocessing(files_to_process, example_process_item, NUM_THREADS, timeout=3)
     for o in outputs: print("MP_status:",o)
 
+    # NB: the inputs can be a generator, and the outputs come out as they are ready
+    lazy_inputs = ( fn for fn in files_to_process )
+    for idx,o in process_streaming(lazy_inputs, file_processor, NUM_THREADS, max_in_flight=4, ordered=False):
+        print("ST_status:",idx,o)
+
+    # NB: the count of the workers is found while processing
+    for idx,o in process_adaptive(files_to_process, file_processor, max_workers=8):
+        print("AD_status:",idx,o)
+
 
 def example__very_simple_files_processor(file_list: List[str], num_threads: int) -> List[Any]:
     """
@@ -0,0 +1,56 @@
+import numpy as np
+from typing import Sequence, Tuple
+import tifffile as TIFF
+from util.tiff_writing import write_tiff
+
+
+# Zeroing of a fixed region (e.g. image corners) in every z-slice of many (mask) images.
+# The region is given as a boolean 2D image, built only once, and the images are
+# streamed page by page (z-slice by z-slice), so a whole stack is never held in memory.
+
+
+def boxes_mask(yx_shape: Sequence[int], boxes: Sequence[Tuple[slice, slice]]) -> np.ndarray:
+    """
+    Returns a boolean 2D image of the 'yx_shape' that is True inside any of the 'boxes',
+    the boxes are (y,x) pairs of slices as if used directly on the image.
+    """
+    mask = np.zeros(yx_shape, dtype=bool)
+    for box in boxes: mask[box] = True
+    return mask
+
+
+def corners_mask(yx_shape: Sequence[int], cw: int) -> np.ndarray:
+    """
+    The four corner boxes as used after the cellpose v4 segmentation, 'cw' is the corner width.
+    """
+    return boxes_mask(yx_shape, [ (slice(0, cw),         slice(0, cw+10)),        # TL
+                                  (slice(0, cw),         slice(-cw, -1)),         # TR
+                                  (slice(-cw-10, -1),    slice(0, cw+30)),        # BL
+                                  (slice(-cw-10, -1),    slice(-cw-10, -1)) ])    # BR
+
+
+def read_yx_shape(file_path: str) -> Tuple[int, int]:
+    with TIFF.TiffFile(file_path) as tif:
+        return tuple(tif.series[0].shape[-2:])
+
+
+def apply_region_mask_to_file(in_path: str, out_path: str, zero_mask: np.ndarray, preset: str = 'fastest', **write_options):
+    """
+    Writes the image from 'in_path' into 'out_path' with pixels under the 'zero_mask'
+    set to zero. The image is read, masked and written one page (z-slice) at a time,
+    and the output appears under the 'out_path' only when it's completely written.
+    The output encoding is given by the 'preset' and 'write_options' of util/tiff_writing.
+    """
+    with TIFF.TiffFile(in_path) as tif:
+        series = tif.series[0]
+        if tuple(series.shape[-2:]) != zero_mask.shape:
+            raise ValueError(f"Mask of shape {zero_mask.shape} does not fit image {in_path} of shape {series.shape}")
+
+        def masked_pages():
+            for page in series.pages:
+                img = page.asarray()
+                img[zero_mask] = 0
+                yield img
+
+        write_tiff(out_path, masked_pages(), preset=preset, atomic=True,
+                   shape=series.shape, dtype=series.dtype, **write_options)
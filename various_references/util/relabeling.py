@@ -0,0 +1,53 @@
+import numpy as np
+from typing import Any, Dict, Tuple
+
+
+# Transfer of labels between two label images of the same objects, e.g. from tracked
+# (downscaled) masks back to the original full-resolution masks: a lookup table (LUT)
+# old_label -> new_label is established from a pair of equally shaped images, and then
+# applied to another image with the old labels (of any shape) in one vectorized pass.
+
+
+def build_label_lut(old_labels: np.ndarray, new_labels: np.ndarray) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Returns a LUT such that 'lut[old_label]' is the new label that covers the most
+    of the 'old_label' pixels (0 if none), and a consistency report, which lists:
+    - 'unmapped': old labels that found no (non-zero) new label,
+    - 'ambiguous': old labels that overlap with more than one new label,
+    - 'merged': new labels that are given to more than one old label.
+    """
+    if old_labels.shape != new_labels.shape:
+        raise ValueError(f"Label images differ in shapes: {old_labels.shape} vs. {new_labels.shape}")
+
+    old_flat = old_labels.ravel().astype(np.int64)
+    new_flat = new_labels.ravel().astype(np.int64)
+    lut = np.zeros(int(old_flat.max(initial=0)) + 1, dtype=new_labels.dtype)
+
+    # unique (old,new) pairs of the foreground, and how many pixels each of them has
+    fg = (old_flat > 0) & (new_flat > 0)
+    pairs, counts = np.unique(np.stack([old_flat[fg], new_flat[fg]]), axis=1, return_counts=True)
+
+    # sort by count and let the largest overlap be written the last (and thus win)
+    order = np.argsort(counts, kind='stable')
+    lut[pairs[0, order]] = pairs[1, order]
+
+    olds, olds_count = np.unique(pairs[0], return_counts=True)
+    seen_old = np.unique(old_flat)
+    seen_old = seen_old[seen_old > 0]
+    mapped_old = lut[seen_old] > 0
+    news_of_mapped = lut[seen_old[mapped_old]]
+    news, news_count = np.unique(news_of_mapped, return_counts=True)
+
+    report = { 'unmapped': seen_old[~mapped_old].tolist(),
+               'ambiguous': olds[olds_count > 1].tolist(),
+               'merged': news[news_count > 1].tolist() }
+    return lut, report
+
+
+def apply_label_lut(labels: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """
+    Returns 'lut[labels]', labels beyond the LUT are mapped to 0.
+    """
+    if labels.size > 0 and labels.max() >= len(lut):
+        lut = np.concatenate([lut, np.zeros(int(labels.max()) + 1 - len(lut), dtype=lut.dtype)])
+    return np.take(lut, labels)
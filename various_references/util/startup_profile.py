@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+import statistics
+from typing import Dict, List, Tuple
+
+
+# Measuring of the start-up time of the entry points (scripts) of this repository:
+#
+# - import profile: runs a script under 'python -X importtime' and reports
+#   the modules that took the longest to import (incl. their sub-imports)
+#
+# - cold-start benchmark: runs a script (typically with '--help', which should
+#   return before anything heavy is imported) several times and compares the median
+#   wall time against a budget, and fails (exit code 1) when the budget is exceeded
+#
+# HOW TO RUN, example (from the 'various_references' folder):
+#   python util/startup_profile.py --import-profile -- ../W_example/cli_facade_example.py --help
+#   python util/startup_profile.py --repeat 5 --budget 0.5 -- segmentation_server.py --help
+#   python util/startup_profile.py --all
+
+
+# the known entry points (relative to the repository root) with their budgets in seconds
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+ENTRY_POINTS: Dict[str, Tuple[List[str], float]] = {
+    'cli_facade_example':    (['W_example/cli_facade_example.py', '--help'], 0.5),
+    'example_tiff_processor': (['various_references/containers/example_tiff_processor.py', '--help'], 0.2),
+    'segmentation_server':   (['various_references/segmentation_server.py', '--help'], 0.3),
+    'segmentation_batch':    (['various_references/segmentation_batch.py', '--help'], 0.3),
+}
+
+
+def import_profile(script_args: List[str], top: int = 15) -> List[Tuple[int, int, str]]:
+    """
+    Returns the 'top' slowest imports of the 'script_args' run, as tuples of
+    (cumulative microseconds, self microseconds, module name).
+    """
+    res = subprocess.run([sys.executable, '-X', 'importtime', *script_args],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in res.stderr.splitlines():
+        # "import time:       self [us] |     cumulative | imported package"
+        if not line.startswith('import time:'): continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit(): continue
+        imports.append((int(fields[1]), int(fields[0]), fields[2].rstrip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def cold_start_times(script_args: List[str], repeat: int = 5) -> List[float]:
+    """
+    Returns the wall times (in seconds) of 'repeat' runs of the 'script_args'.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *script_args], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def check_budget(name: str, script_args: List[str], budget: float, repeat: int) -> bool:
+    median = statistics.median(cold_start_times(script_args, repeat))
+    ok = median <= budget
+    print(f"{name}: median cold start {median:.3f} s, budget {budget:.3f} s -> {'OK' if ok else 'OVER BUDGET'}")
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Start-up time profiling and benchmarking of the entry points.")
+    parser.add_argument('script_args', nargs='*', help="the script and its arguments (put after '--')")
+    parser.add_argument('--import-profile', action='store_true', help="report the slowest imports of the script")
+    parser.add_argument('--top', type=int, default=15, help="how many slowest imports to report")
+    parser.add_argument('--repeat', type=int, default=5, help="how many times to run the script for the benchmark")
+    parser.add_argument('--budget', type=float, default=None, help="max. allowed median cold-start time in seconds")
+    parser.add_argument('--all', action='store_true', help="benchmark all known entry points against their budgets")
+    args = parser.parse_args()
+
+    if args.all:
+        all_ok = True
+        for name,(script_args,budget) in ENTRY_POINTS.items():
+            script_args = [os.path.join(REPO_ROOT, script_args[0]), *script_args[1:]]
+            all_ok &= check_budget(name, script_args, budget, args.repeat)
+        sys.exit(0 if all_ok else 1)
+
+    if len(args.script_args) == 0: parser.error("no script given")
+
+    if args.import_profile:
+        print(f"{'cumulative [ms]':>16} {'self [ms]':>10}  module")
+        for cumulative,self_time,module in import_profile(args.script_args, args.top):
+            print(f"{cumulative/1000:16.1f} {self_time/1000:10.1f}  {module}")
+
+    if args.budget is not None:
+        sys.exit(0 if check_budget(args.script_args[0], args.script_args, args.budget, args.repeat) else 1)
+    elif not args.import_profile:
+        times = cold_start_times(args.script_args, args.repeat)
+        print(f"cold start: median {statistics.median(times):.3f} s, min {min(times):.3f} s, max {max(times):.3f} s")
@@ -0,0 +1,68 @@
+from typing import Any, Dict, Optional, Sequence
+import tifffile as TIFF
+from util.checkpointing import atomic_write_tiff
+
+
+# One place to decide how the TIFF outputs are encoded, so that every pipeline stage
+# can choose between the fastest write and the smallest file. Compressed data is encoded
+# by tifffile in 'maxworkers' threads, one strip or tile per thread, so it pays off to
+# have more strips/tiles per page (the 'rowsperstrip' or 'tile' options).
+#
+# NB: 'lzw', 'zlib' and 'zstd' require the 'imagecodecs' package (see the pixi.toml),
+#     and 'lzw' is the one that also older readers (e.g. Fiji) understand
+
+CODECS = ['none', 'lzw', 'zlib', 'zstd']
+
+PRESETS = {
+    'fastest':    dict(codec='none'),
+    'balanced':   dict(codec='zstd', level=1, predictor=True, rowsperstrip=64),
+    'smallest':   dict(codec='zstd', level=19, predictor=True, rowsperstrip=64),
+    'compatible': dict(codec='lzw', predictor=True, rowsperstrip=64),
+}
+
+
+def tiff_write_options(preset: Optional[str] = None,
+                       codec: Optional[str] = None,
+                       level: Optional[int] = None,
+                       predictor: Optional[bool] = None,
+                       maxworkers: Optional[int] = None,
+                       tile: Optional[Sequence[int]] = None,
+                       rowsperstrip: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Returns the keyword arguments for 'tifffile.imwrite()' that are given by the 'preset'
+    (see PRESETS), possibly adjusted by any other given (not None) parameter.
+    The 'predictor' (horizontal differencing) helps mainly the compression of label images.
+    """
+    options = dict(PRESETS[preset]) if preset is not None else dict(codec='none')
+    for key,value in [('codec',codec), ('level',level), ('predictor',predictor),
+                      ('maxworkers',maxworkers), ('tile',tile), ('rowsperstrip',rowsperstrip)]:
+        if value is not None: options[key] = value
+
+    if options['codec'] not in CODECS:
+        raise ValueError(f"Unknown codec '{options['codec']}', use one of {CODECS}")
+
+    kwargs = dict()
+    if options['codec'] != 'none':
+        kwargs['compression'] = options['codec']
+        if options.get('level') is not None: kwargs['compressionargs'] = {'level': options['level']}
+        if options.get('predictor'): kwargs['predictor'] = True
+    for key in ['maxworkers', 'tile', 'rowsperstrip']:
+        if options.get(key) is not None: kwargs[key] = options[key]
+    if 'tile' in kwargs: kwargs.pop('rowsperstrip', None)  # tiles and strips are exclusive
+    return kwargs
+
+
+def write_tiff(file_path: str, data, preset: Optional[str] = 'fastest', atomic: bool = False, **options):
+    """
+    Writes the 'data' with the encoding given by the 'preset' and any 'options' of
+    'tiff_write_options()'. Extra keywords of 'tifffile.imwrite()' (e.g. 'shape' and
+    'dtype' when writing from an iterator of pages) are passed through.
+    With 'atomic', the file appears under 'file_path' only after it's completely written.
+    """
+    own_keys = ['codec', 'level', 'predictor', 'maxworkers', 'tile', 'rowsperstrip']
+    kwargs = tiff_write_options(preset, **{ k:options.pop(k) for k in own_keys if k in options })
+    kwargs.update(options)
+    if atomic:
+        atomic_write_tiff(file_path, data, **kwargs)
+    else:
+        TIFF.imwrite(file_path, data, **kwargs)
@@ -0,0 +1,124 @@
+import numpy as np
+from typing import Callable, List, Optional, Sequence, Tuple
+import util.parallelism_paradigms as P
+
+
+# Tiled segmentation of (big) volumes: the volume is split into overlapping tiles that are
+# segmented independently, and the tiles' labels are stitched into one consistent label image.
+#
+# Every tile contributes only its "core" to the output -- the tile without half of the
+# overlap on each inner side -- so the cores partition the volume. The remaining "margin"
+# of a tile is used to recognize objects that are already present in the output (written
+# from the cores of the previous tiles), and such objects inherit the existing labels.
+
+
+def tile_slices(shape: Sequence[int], tile_shape: Sequence[int], overlap: Sequence[int]) -> List[Tuple[slice, ...]]:
+    """
+    Returns the list of (overlapping) tiles, each given as a tuple of slices, that covers
+    the whole volume of the 'shape'. Tiles are 'tile_shape' big (or smaller at the volume's end),
+    and neighbouring tiles share 'overlap' pixels (both given per axis). An axis that is covered
+    by a single tile needs no overlap, so the 'overlap' may be even larger than such an axis.
+    """
+    per_axis = []
+    for size,tile,ov in zip(shape, tile_shape, overlap):
+        if ov >= tile: raise ValueError(f"Overlap {ov} must be smaller than the tile size {tile}")
+        tile = min(tile, size)
+        ov = 0 if tile >= size else min(ov, tile-1)
+        starts = list(range(0, max(1, size - ov), tile - ov))
+        per_axis.append([ slice(s, min(s+tile, size)) for s in starts if s == 0 or s + ov < size ])
+
+    tiles = [()]
+    for axis_slices in per_axis:
+        tiles = [ t + (s,) for t in tiles for s in axis_slices ]
+    return tiles
+
+
+def core_slices(tile: Tuple[slice, ...], shape: Sequence[int], overlap: Sequence[int]) -> Tuple[slice, ...]:
+    """
+    Returns the part of the 'tile' that is not shared with any neighbouring tile
+    (half of the overlap is given to each of the two neighbours).
+    """
+    return tuple( slice(s.start + (ov//2 if s.start > 0 else 0),
+                        s.stop - (ov - ov//2 if s.stop < size else 0))
+                  for s,size,ov in zip(tile, shape, overlap) )
+
+
+def _intersection_in_tile(tile: Tuple[slice, ...], other: Tuple[slice, ...]) -> Optional[Tuple[slice, ...]]:
+    # returns the intersection of the two slices tuples, relative to the 'tile'
+    res = []
+    for t,o in zip(tile, other):
+        start, stop = max(t.start, o.start), min(t.stop, o.stop)
+        if start >= stop: return None
+        res.append(slice(start - t.start, stop - t.start))
+    return tuple(res)
+
+
+def segment_tiled(volume, segment_fun: Callable[[np.ndarray], np.ndarray],
+                  tile_shape: Sequence[int], overlap: Sequence[int],
+                  num_workers: int = 1, out: Optional[np.ndarray] = None,
+                  min_overlap_fraction: float = 0.5) -> np.ndarray:
+    """
+    Returns label image of the 'volume' (any array-like, e.g. a memmap, that reads only
+    what is sliced) segmented tile by tile with 'segment_fun(tile) -> tile_labels'.
+    Up to 'num_workers' tiles are segmented in parallel (in threads), and only about
+    twice as many tiles are kept in the memory at any moment.
+
+    The output is written into 'out' (e.g. a memmap), or into a new uint32 array.
+    A tile's object takes over the label of an already existing object when they
+    overlap (within the tiles' shared regions) in at least 'min_overlap_fraction'
+    of each of the two objects' pixels there.
+    """
+    shape = volume.shape
+    if out is None: out = np.zeros(shape, dtype=np.uint32)
+    tiles = tile_slices(shape, tile_shape, overlap)
+
+    def segment_tile(tile):
+        return segment_fun(np.asarray(volume[tile]))
+
+    placed_cores = []
+    next_label = 1
+    for idx,labels in P.process_streaming(tiles, segment_tile, num_workers, thread_names='tileSegmenter'):
+        if isinstance(labels, tuple): raise RuntimeError(f"Segmenting tile {tiles[idx]} failed: {labels[1]}")
+        tile = tiles[idx]
+        labels = np.asarray(labels).astype(np.int64)
+
+        # the part of this tile that has been already written from previous tiles
+        written = np.zeros(labels.shape, dtype=bool)
+        for core in placed_cores:
+            inter = _intersection_in_tile(tile, core)
+            if inter is not None: written[inter] = True
+
+        lut = np.zeros(int(labels.max(initial=0)) + 1, dtype=np.int64)
+        if written.any():
+            tile_l = labels[written]
+            existing_l = np.asarray(out[tile])[written].astype(np.int64)
+            tile_ids, tile_counts = np.unique(tile_l[tile_l > 0], return_counts=True)
+            ex_ids, ex_counts = np.unique(existing_l[existing_l > 0], return_counts=True)
+            tile_sizes = dict(zip(tile_ids.tolist(), tile_counts.tolist()))
+            ex_sizes = dict(zip(ex_ids.tolist(), ex_counts.tolist()))
+
+            both = (tile_l > 0) & (existing_l > 0)
+            pairs, counts = np.unique(np.stack([tile_l[both], existing_l[both]]), axis=1, return_counts=True)
+            # the largest overlaps first, every tile object and every existing object is matched at most once
+            matched_existing = set()
+            for k in np.argsort(-counts, kind='stable'):
+                t,e,c = int(pairs[0,k]), int(pairs[1,k]), counts[k]
+                if lut[t] > 0 or e in matched_existing: continue
+                if c >= min_overlap_fraction * tile_sizes[t] and c >= min_overlap_fraction * ex_sizes[e]:
+                    lut[t] = e
+                    matched_existing.add(e)
+
+        # fresh labels for all the other objects of this tile's core
+        core = core_slices(tile, shape, overlap)
+        core_labels = labels[_intersection_in_tile(tile, core)]
+        present = np.zeros(len(lut), dtype=bool)
+        present[core_labels.ravel()] = True
+        fresh = np.flatnonzero(present & (lut == 0))
+        fresh = fresh[fresh > 0]
+        lut[fresh] = np.arange(next_label, next_label + len(fresh))
+        next_label += len(fresh)
+
+        out[core] = lut[core_labels]
+        placed_cores.append(core)
+
+    return out
@@ -0,0 +1,70 @@
+import os
+import json
+from typing import Any, Dict, Optional
+import numpy as np
+
+
+class TimeSeriesStore:
+    """
+    An on-disk store of a time series of equally shaped images, e.g. of the downscaled
+    frames of a CTC folder. The whole series is kept as one raw '.npy' file that is
+    memory-mapped, so it is never required to hold the full series in RAM, plus
+    a small '.json' file with the parameters that were used to create the series.
+
+    The store is considered complete only after 'mark_complete()' has been called,
+    so an interrupted filling is not mistaken for a valid store in the next run.
+    A complete store, created with the same parameters, is reopened instantly.
+    """
+    def __init__(self, folder: str, name: str):
+        self.data_path = os.path.join(folder, f"{name}.npy")
+        self.meta_path = os.path.join(folder, f"{name}.json")
+
+    def read_meta(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.meta_path): return None
+        with open(self.meta_path, 'r') as f:
+            return json.load(f)
+
+    def is_complete(self, params: Dict[str, Any]) -> bool:
+        """
+        Returns True if the store exists, has been completely filled,
+        and was created with the same 'params'.
+        """
+        meta = self.read_meta()
+        return meta is not None \
+            and meta.get('complete', False) \
+            and meta.get('params') == json.loads(json.dumps(params)) \
+            and os.path.exists(self.data_path)
+
+    def create(self, shape, dtype, params: Dict[str, Any]) -> np.memmap:
+        """
+        Returns a new writable memory-mapped array of the given 'shape' and 'dtype',
+        any previous content of this store is discarded.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.data_path)), exist_ok=True)
+        self._write_meta({'complete': False, 'params': params})
+        return np.lib.format.open_memmap(self.data_path, mode='w+', dtype=dtype, shape=tuple(shape))
+
+    def mark_complete(self, array: np.memmap, **extra_meta):
+        """
+        Flushes the 'array' (obtained from 'create()') to the disk and flags the store
+        as complete. Any 'extra_meta' items are saved along for the later runs.
+        """
+        array.flush()
+        meta = self.read_meta()
+        meta.update(extra_meta)
+        meta['complete'] = True
+        self._write_meta(meta)
+
+    def open(self, mode: str = 'c') -> np.memmap:
+        """
+        Returns the memory-mapped array of a complete store; the default
+        copy-on-write 'mode' permits modifications that never reach the disk.
+        """
+        return np.load(self.data_path, mmap_mode=mode)
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        # temp-then-rename, so that the meta file is never seen half-written
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, self.meta_path)
@@ -0,0 +1,137 @@
+import os
+import time
+import shutil
+import logging
+from typing import Iterable, Iterator, Optional
+
+
+class FileClaimQueue:
+    """
+    A work queue that lives only as (empty) files in a folder on a shared filesystem,
+    so that several independent workers (e.g. tasks of a SLURM job array) can take
+    items from it dynamically -- without any service running. An item is "moved"
+    between the sub-folders of the queue with an atomic 'os.rename()':
+
+        todo/ITEM  ->  claimed/ITEM@WORKER  ->  done/ITEM  or  failed/ITEM
+
+    Only one worker can succeed renaming a particular 'todo/ITEM', which makes him
+    the owner of the item. A worker that is restarted (with the same 'worker_id')
+    puts its previously claimed (thus interrupted) items back to 'todo', and the
+    same happens to the failed items -- items in 'done' are never processed again.
+    """
+    def __init__(self, folder: str, worker_id: str):
+        self.folder = folder
+        self.worker_id = str(worker_id)
+        self.todo_dir = os.path.join(folder, "todo")
+        self.claimed_dir = os.path.join(folder, "claimed")
+        self.done_dir = os.path.join(folder, "done")
+        self.failed_dir = os.path.join(folder, "failed")
+
+    def populate(self, items: Iterable[str], wait_timeout: float = 600.0):
+        """
+        Creates the queue with the given 'items', if it does not exist yet. When more
+        workers attempt it at the same time, only one creates it and others wait for it.
+        A worker that waits longer than 'wait_timeout' seconds considers the creator dead,
+        and creates the queue itself; a restarted creator (the same 'worker_id') redoes
+        its creation right away. Afterwards, this worker's stale claims and all failed
+        items are returned to the queue.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        lock_dir = os.path.join(self.folder, "populating")
+        ready_flag = os.path.join(self.folder, "ready")
+        while not os.path.exists(ready_flag):
+            try:
+                os.mkdir(lock_dir)   # atomic, acts as a lock
+                open(os.path.join(lock_dir, self.worker_id), 'w').close()   # who holds it
+            except FileExistsError:
+                if not os.path.exists(os.path.join(lock_dir, self.worker_id)):
+                    self._wait_for_population(lock_dir, ready_flag, wait_timeout)
+                    continue
+                logging.info(f"Queue in {self.folder} is re-populated by its restarted creator {self.worker_id}")
+            self._create(items)
+            open(ready_flag, 'w').close()
+
+        self.requeue()
+
+    def _wait_for_population(self, lock_dir: str, ready_flag: str, wait_timeout: float):
+        # returns when the queue is ready, or when the (stale) lock is gone and can be taken again
+        waiting_since = time.time()
+        while not os.path.exists(ready_flag):
+            if not os.path.exists(lock_dir): return
+            if time.time() - waiting_since > wait_timeout:
+                stale_dir = f"{lock_dir}.stale.{self.worker_id}"
+                try:
+                    os.rename(lock_dir, stale_dir)   # only one of the waiting workers succeeds
+                    shutil.rmtree(stale_dir, ignore_errors=True)
+                    logging.warning(f"Queue in {self.folder} has not been populated in time, taking over its population")
+                except FileNotFoundError:
+                    pass  # someone else has taken it over already
+                return
+            time.sleep(1)
+
+    def _create(self, items: Iterable[str]):
+        for d in [self.claimed_dir, self.done_dir, self.failed_dir]:
+            os.makedirs(d, exist_ok=True)
+        if os.path.exists(self.todo_dir):
+            return   # an interrupted creator got that far, and the 'todo' is complete (see below)
+
+        # the 'todo' is filled aside and renamed into place, so it appears complete or not at all
+        tmp_dir = f"{self.todo_dir}.{self.worker_id}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)   # left over by this worker's interrupted attempt
+        os.makedirs(tmp_dir)
+        for item in items:
+            open(os.path.join(tmp_dir, str(item)), 'w').close()
+        try:
+            if os.path.exists(self.todo_dir): raise FileExistsError(self.todo_dir)
+            os.rename(tmp_dir, self.todo_dir)
+        except OSError:
+            # another creator (that was taken for dead) has finished meanwhile
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def requeue(self):
+        """
+        Returns the items claimed by this worker and all failed items back to 'todo'.
+        """
+        suffix = f"@{self.worker_id}"
+        for name in os.listdir(self.claimed_dir):
+            if name.endswith(suffix):
+                self._move(os.path.join(self.claimed_dir, name), name[:-len(suffix)], self.todo_dir)
+        for name in os.listdir(self.failed_dir):
+            self._move(os.path.join(self.failed_dir, name), name, self.todo_dir)
+
+    def claim(self) -> Optional[str]:
+        """
+        Returns a next item that is now exclusively owned by this worker, or None if no item is left.
+        """
+        while True:
+            names = sorted(os.listdir(self.todo_dir))
+            if len(names) == 0: return None
+            for name in names:
+                try:
+                    os.rename(os.path.join(self.todo_dir, name),
+                              os.path.join(self.claimed_dir, f"{name}@{self.worker_id}"))
+                    return name
+                except FileNotFoundError:
+                    pass  # someone else was faster, try the next one
+
+    def mark_done(self, item: str):
+        self._move(self._claimed_path(item), item, self.done_dir)
+
+    def mark_failed(self, item: str):
+        self._move(self._claimed_path(item), item, self.failed_dir)
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Claims items one after another, the consumer must mark each item as done or failed.
+        """
+        while (item := self.claim()) is not None:
+            yield item
+
+    def _claimed_path(self, item: str) -> str:
+        return os.path.join(self.claimed_dir, f"{item}@{self.worker_id}")
+
+    def _move(self, src_path: str, item: str, dst_dir: str):
+        try:
+            os.rename(src_path, os.path.join(dst_dir, item))
+        except FileNotFoundError:
+            logging.warning(f"Queue item {item} vanished from {src_path}")